@@ -0,0 +1,71 @@
+import sys
+sys.path.append('C:/Program Files (x86)/Keysight/SD1/Libraries/Python')
+import time
+from collections import namedtuple
+
+# Bulk AWG queue building.
+#
+# Filling a deep AWG queue means one AWGqueueWaveform call per entry, and the reproducers used to do that in a plain
+# loop that dropped every return code. A QueuePlan lists the entries up front and submit_queue() pushes them with as
+# little Python work per entry as possible (the bound driver method and the entry tuples are resolved before the loop),
+# collecting the failures by entry index and measuring the fill rate:
+#
+#   plan = QueuePlan()
+#   plan.add(1, keysightSD1.SD_TriggerModes.SWHVITRIG_CYCLE, count=1000)
+#   result = submit_queue(awg, 1, plan)
+#   print(result)    # Queued 1000 entries in 0.052 s (19230 entries/s), 0 failures
+#
+# The SD1 driver has no call that queues several entries at once, so the driver round trip per entry remains.
+
+QueueEntry = namedtuple("QueueEntry", ["wfmNum", "triggerMode", "startDelay", "cycles", "prescaler"])
+
+
+class QueuePlan:
+
+    def __init__(self, entries=None):
+        self.entries = [QueueEntry(*entry) for entry in entries] if entries else [] # FORMAT: [QueueEntry]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, wfmNum, triggerMode, startDelay=0, cycles=1, prescaler=0, count=1):
+        # Appends count identical entries
+        self.entries.extend([QueueEntry(wfmNum, triggerMode, startDelay, cycles, prescaler)] * count)
+        return self
+
+    def extend(self, plan, count=1):
+        # Appends the entries of another plan, count times
+        self.entries.extend(plan.entries * count)
+        return self
+
+
+class QueueResult:
+
+    def __init__(self, entries, failures, seconds):
+        self.entries = entries
+        self.failures = failures # FORMAT: [(ENTRY INDEX, ERROR CODE)]
+        self.seconds = seconds
+
+    @property
+    def entries_per_second(self):
+        return self.entries / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        return "Queued {} entries in {:.3f} s ({:.0f} entries/s), {} failures".format(
+            self.entries, self.seconds, self.entries_per_second, len(self.failures))
+
+
+def submit_queue(moduleAOU, nAWG, plan):
+    # Queues every entry of plan on AWG nAWG, in order. Failed entries are recorded and the remaining ones still queued
+    queue_waveform = moduleAOU.AWGqueueWaveform
+    entries = plan.entries
+    failures = []
+
+    start = time.perf_counter()
+    for index, entry in enumerate(entries):
+        error = queue_waveform(nAWG, *entry)
+        if isinstance(error, int) and error < 0:
+            failures.append((index, error))
+    seconds = time.perf_counter() - start
+
+    return QueueResult(len(entries), failures, seconds)
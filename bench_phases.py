@@ -0,0 +1,213 @@
+import sys
+import argparse
+import json
+import platform
+import statistics
+import time
+from datetime import datetime
+sys.path.append('C:/Program Files (x86)/Keysight/SD1/Libraries/Python')
+
+# Per-phase benchmark of the four bench tests.
+#
+# Runs each test N times through the same steps as test_bench.py, timing every phase separately:
+#   open       creating the Test object (opening the modules, or borrowing them from the ModulePool)
+#   hw_config  configure_hardware
+#   hvi_config configure_hvi (building and lowering the sequence, or finding it in hvi_cache)
+#   compile    Test.compile_hvi (skipped by hvi_cache when the instance was compiled before)
+#   load       Test.load_hvi (load_to_hw of every KtHvi instance, and the WfNum RegisterBank of fast branching)
+#   run        Test.start_hvi (run of every KtHvi instance, plus --triggers fast branching triggers)
+#   release    Test.release_hvi
+#   close      Test.close_modules (handing the modules back to the pool, or closing them)
+#
+# By default the modules stay open in a ModulePool for the whole session, so the first repetition of each test is
+# cold and the following ones are warm (pool, hvi_cache and waveform residency all reused). With --cold every
+# repetition opens its own modules and starts from an empty hvi_cache. The cold statistics of a pooled session therefore
+# come from a single run each (n=1, no stdev); use --cold to measure the spread of cold runs.
+#
+#   python bench_phases.py --repeat 5 --json phases.json                    (hardware)
+#   python bench_phases.py --simulate --repeat 5 --json phases.json         (sim_backend.py)
+#
+# With --triggers, the external trigger module is opened once for the whole session, outside the timed phases, and
+# closed at the end.
+#
+# The JSON file holds the raw timings of every repetition and the cold/warm statistics per test and phase.
+
+if __name__ == '__main__' and '--simulate' in sys.argv:
+    import sim_backend
+    scale = sys.argv[sys.argv.index('--sim-latency-scale') + 1] if '--sim-latency-scale' in sys.argv else 1.0
+    sim_backend.install(sim_backend.LatencyModel(scale=float(scale)))
+
+from hardware_configurator import configure_hardware
+from hvi_configurator import configure_hvi
+from hvi_cache import hvi_cache
+from module_pool import ModulePool
+from tracing import tracer
+from test_initialization import *
+
+TESTS = ["helloworld", "helloworldmimo", "mimoresync", "fastbranching"]
+PHASES = ["open", "hw_config", "hvi_config", "compile", "load", "run", "release", "close"]
+
+
+def _location(text):
+    chassis, slot = text.split(",")
+    return [int(chassis), int(slot)]
+
+
+def make_test(test_key, module_dict, master_location, pool):
+    master = {"chassis": master_location[0], "slot": master_location[1]}
+    if test_key == "helloworld":
+        return test_helloworld(module_dict, pool=pool)
+    if test_key == "helloworldmimo":
+        return test_helloworldmimo(module_dict, pool=pool)
+    if test_key == "mimoresync":
+        return test_mimoresync(module_dict, master, pool=pool)
+    if test_key == "fastbranching":
+        return test_fastbranching(module_dict, master, pool=pool)
+    raise ValueError("Unknown test {}".format(test_key))
+
+
+def open_trigger_module(trigger_location):
+    # Opens the external trigger module of fast branching. Returns the module, or None if it could not be opened
+    module = keysightSD1.SD_AOU()
+    error = module.openWithSlot("", trigger_location[0], trigger_location[1])
+    if isinstance(error, int) and error < 0:
+        print("[ERROR] bench_phases.open_trigger_module: Could not open the trigger module in Chassis {}, Slot {} ({})".format(
+            trigger_location[0], trigger_location[1], error))
+        return None
+    return module
+
+
+def run_once(test_key, module_dict, master_location, pool, trigger_module=None, triggers=0):
+    # One pass of a test. Returns {phase: seconds}. trigger_module: open trigger module for the fast branching triggers
+    phases = {}
+
+    def timed(phase, call):
+        start = time.perf_counter()
+        result = call()
+        phases[phase] = time.perf_counter() - start
+        return result
+
+    test = timed("open", lambda: make_test(test_key, module_dict, master_location, pool))
+    timed("hw_config", lambda: configure_hardware(test))
+    timed("hvi_config", lambda: configure_hvi(test))
+    timed("compile", test.compile_hvi)
+    timed("load", test.load_hvi)
+
+    def run():
+        test.start_hvi()
+        if test_key == "fastbranching" and triggers and trigger_module is not None:
+            test.extTrigModule = trigger_module
+            test.seq_master.registers["cycleCnt"].write(0)
+            test.run_triggers(triggers)
+    timed("run", run)
+
+    timed("release", test.release_hvi)
+    timed("close", test.close_modules)
+    return phases
+
+
+def _stats(values):
+    if not values:
+        return None
+    return {"n": len(values),
+            "mean": statistics.mean(values),
+            "stdev": statistics.stdev(values) if len(values) > 1 else None, # undefined for a single run
+            "min": min(values),
+            "max": max(values)}
+
+
+def summarize(runs):
+    # {test: {phase: {"cold": stats, "warm": stats}}}
+    summary = {}
+    for test_key in dict.fromkeys(run["test"] for run in runs):
+        summary[test_key] = {}
+        for phase in PHASES + ["total"]:
+            summary[test_key][phase] = {
+                kind: _stats([run["phases"][phase] for run in runs
+                              if run["test"] == test_key and run["cold"] == (kind == "cold")])
+                for kind in ("cold", "warm")}
+    return summary
+
+
+def run_benchmark(tests, module_array, master_location, repeat, cold=False, trigger_location=None, triggers=0):
+    # Returns {"meta", "runs": [{"test", "repetition", "cold", "phases"}], "summary"}
+    module_dict = create_module_inventory(module_array)
+    pool = None
+    trigger_module = None
+    if triggers and "fastbranching" in tests:
+        trigger_module = open_trigger_module(trigger_location)
+    runs = []
+    for repetition in range(0, repeat):
+        for test_key in tests:
+            if cold:
+                hvi_cache.clear()
+            pool_open_time = 0.0
+            if not cold and pool is None:
+                start = time.perf_counter()
+                pool = ModulePool(module_dict)
+                pool_open_time = time.perf_counter() - start
+
+            phases = run_once(test_key, module_dict, master_location, None if cold else pool, trigger_module, triggers)
+            phases["open"] += pool_open_time # the first test of a pooled session pays for opening the pool
+            phases["total"] = sum(phases[phase] for phase in PHASES)
+            runs.append({"test": test_key, "repetition": repetition, "cold": cold or repetition == 0, "phases": phases})
+    if pool is not None:
+        pool.close()
+    if trigger_module is not None:
+        trigger_module.close()
+
+    meta = {"date": datetime.now().isoformat(timespec="seconds"),
+            "backend": "simulated" if getattr(keysightSD1, "SIMULATED", False) else "hardware",
+            "python": platform.python_version(),
+            "host": platform.node(),
+            "repeat": repeat,
+            "mode": "cold" if cold else "pooled",
+            "modules": module_array,
+            "master": master_location,
+            "triggers": triggers}
+    if meta["backend"] == "simulated":
+        import sim_backend
+        meta["latency_scale"] = sim_backend.latency.scale
+    return {"meta": meta, "runs": runs, "summary": summarize(runs)}
+
+
+def print_summary(results):
+    if results["meta"]["mode"] == "pooled":
+        print("Pooled session: the cold column is the first repetition only (n=1, no stdev); use --cold for cold statistics")
+    print("{:<16} {:<10} {:>12} {:>12} {:>12} {:>12}".format("test", "phase", "cold mean", "warm mean", "warm stdev", "warm max"))
+    fmt = lambda stats, key: "{:.4f}".format(stats[key]) if stats is not None and stats[key] is not None else "-"
+    for test_key, phases in results["summary"].items():
+        for phase, stats in phases.items():
+            print("{:<16} {:<10} {:>12} {:>12} {:>12} {:>12}".format(test_key, phase, fmt(stats["cold"], "mean"),
+                  fmt(stats["warm"], "mean"), fmt(stats["warm"], "stdev"), fmt(stats["warm"], "max")))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Per-phase timing of the bench tests")
+    parser.add_argument('--repeat', help='Repetitions of each test', type=int, default=5)
+    parser.add_argument('--tests', help='Tests to run', nargs='+', choices=TESTS, default=TESTS)
+    parser.add_argument('--modules', help='Module locations as chassis,slot', nargs='+', type=_location, default=[[1, 7], [1, 10]])
+    parser.add_argument('--master', help='Master module location (chassis,slot)', type=_location, default=[1, 7])
+    parser.add_argument('--trigger-module', help='Trigger module location (chassis,slot) for --triggers', type=_location, default=[1, 8])
+    parser.add_argument('--triggers', help='Fast branching triggers fired in the run phase', type=int, default=0)
+    parser.add_argument('--cold', help='Open the modules and start from an empty HVI cache in every repetition', action='store_true')
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--trace', help='Also record timing spans and write them to this file as a Chrome trace (see tracing.py)')
+    parser.add_argument('--simulate', help='Run on the simulated keysightSD1/pyhvi backend (sim_backend.py)', action='store_true')
+    parser.add_argument('--sim-latency-scale', help='With --simulate, factor applied to every simulated latency', type=float, default=1.0)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.trace:
+        tracer.enable()
+    results = run_benchmark(args.tests, args.modules, args.master, args.repeat, args.cold, args.trigger_module, args.triggers)
+    print_summary(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Results written to {}".format(args.json))
+    if args.trace:
+        tracer.export(args.trace)
+        print(tracer.report())
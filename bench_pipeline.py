@@ -0,0 +1,135 @@
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hardware_configurator import configure_hardware
+from hvi_configurator import configure_hvi
+
+# Pipelined test runner.
+#
+# test_bench.py runs its tests strictly one after another: configure, compile, load, run, release. Building and
+# compiling an HVI does not need the hardware, so here the next test is created, configured and compiled on a worker
+# thread while the current test is on hardware. As soon as the current test releases its resources, the next one only
+# needs its hardware configuration before it is loaded and run.
+#
+#   report = run_pipelined([lambda: test_helloworld(module_dict, pool=module_pool),
+#                           lambda: test_helloworldmimo(module_dict, pool=module_pool)],
+#                          hold={"helloworldmimo": lambda test: time.sleep(1)})
+#
+# Hardware idle time is the time between one test's release and the next test's run_hvi() call, i.e. the next test's
+# hardware configuration plus any wait for its build to finish.
+#
+# What a build prints on the worker thread is held back and printed by the main thread when that test is picked up, so
+# the output of the two threads does not interleave. The tests borrow their modules from a ModulePool from both
+# threads; the pool serializes lend() and give_back() itself.
+
+
+class _BufferedStdout:
+    # Stands in for sys.stdout during run_pipelined(): writes from a thread that called capture() are kept until it
+    # calls release(), everything else goes straight to the real stream
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffers = {} # FORMAT: {THREAD ID: [TEXT, ...]}
+
+    def write(self, text):
+        buffer = self.buffers.get(threading.get_ident())
+        if buffer is None:
+            return self.stream.write(text)
+        buffer.append(text)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def capture(self):
+        self.buffers[threading.get_ident()] = []
+
+    def release(self):
+        return "".join(self.buffers.pop(threading.get_ident(), []))
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def _build(make_test, stdout):
+    # Worker side: create the test object, configure and compile its HVI. Returns (test, seconds, printed output)
+    stdout.capture()
+    try:
+        start = time.perf_counter()
+        test = make_test()
+        configure_hvi(test)
+        test.compile_hvi()
+        return test, time.perf_counter() - start, stdout.release()
+    except BaseException:
+        stdout.stream.write(stdout.release())
+        raise
+
+
+def run_pipelined(test_factories, hold=None):
+    # test_factories: callables returning a new Test object, run in order. They are called on the worker thread
+    # hold:           {test_key: callable(test)} run while the test is on hardware, between run_hvi() and release_hvi()
+    #                 (e.g. wait for the user, or drive the fast branching loop)
+    # Returns {"tests": [per-test timings], "idle_time": total hardware idle seconds, "total_time": seconds}
+
+    hold = hold or {}
+    report = {"tests": [], "idle_time": 0.0, "total_time": 0.0}
+    if not test_factories:
+        return report
+
+    start = time.perf_counter()
+    stdout = _BufferedStdout(sys.stdout)
+    sys.stdout = stdout
+    try:
+        _run_pipeline(test_factories, hold, report, stdout)
+    finally:
+        sys.stdout = stdout.stream
+    report["total_time"] = time.perf_counter() - start
+    return report
+
+
+def _run_pipeline(test_factories, hold, report, stdout):
+    with ThreadPoolExecutor(max_workers=1) as worker:
+        next_build = worker.submit(_build, test_factories[0], stdout)
+        released_at = None
+
+        for index in range(0, len(test_factories)):
+            wait_start = time.perf_counter()
+            test, build_time, build_output = next_build.result()
+            build_wait = time.perf_counter() - wait_start
+            stdout.write(build_output)
+
+            # Start building the following test before this one goes on hardware
+            if index + 1 < len(test_factories):
+                next_build = worker.submit(_build, test_factories[index + 1], stdout)
+
+            hw_config_start = time.perf_counter()
+            configure_hardware(test)
+            run_start = time.perf_counter()
+            idle = run_start - released_at if released_at is not None else 0.0
+
+            test.run_hvi()
+            if test.test_key in hold:
+                hold[test.test_key](test)
+            hw_end = time.perf_counter()
+
+            test.release_hvi()
+            test.close_modules()
+            released_at = time.perf_counter()
+
+            report["tests"].append({"test": test.test_key,
+                                    "build_time": build_time,
+                                    "build_wait": build_wait,
+                                    "hw_config_time": run_start - hw_config_start,
+                                    "hardware_time": hw_end - run_start,
+                                    "release_time": released_at - hw_end,
+                                    "idle_before": idle})
+            report["idle_time"] += idle
+
+
+def print_pipeline_report(report):
+    for entry in report["tests"]:
+        print("{:<16} build {:.3f} s (waited {:.3f} s), hw config {:.3f} s, on hardware {:.3f} s, release {:.3f} s, idle before {:.3f} s".format(
+            entry["test"], entry["build_time"], entry["build_wait"], entry["hw_config_time"], entry["hardware_time"],
+            entry["release_time"], entry["idle_before"]))
+    print("Hardware idle between tests: {:.3f} s of {:.3f} s total".format(report["idle_time"], report["total_time"]))
@@ -0,0 +1,189 @@
+import sys
+import argparse
+import json
+import math
+import statistics
+import time
+import numpy
+sys.path.append('C:/Program Files (x86)/Keysight/SD1/Libraries/Python')
+
+# Module-count scaling benchmark.
+#
+# Builds helloworldmimo, mimoresync and fastbranching for a growing number of engines (2, 4, 8, 16, 32 by default, one
+# engine per module) and measures, for each count:
+#   build    configure_hvi: building the HviSequence and lowering it to a KtHvi (the HVI cache is cleared first)
+#   compile  Test.compile_hvi
+#   load     Test.load_hvi (the instance is released again right after)
+# Each measurement is the median of --repeat runs. For every test and phase a power law t = a * n^k is fitted to the
+# timings (least squares in log-log space); k close to 1 is linear growth. A fixed per-call cost (e.g. the base compile
+# time) pulls the fitted k below 1 at small counts, so the local exponent between the two largest counts is reported
+# too. Either one above 1 + --tolerance is flagged as super-linear.
+#
+#   python bench_scaling.py --modules 1,2 1,3 1,4 ... 2,17          (hardware: the first n modules are used)
+#   python bench_scaling.py --discover                              (hardware: every module found in the chassis)
+#   python bench_scaling.py --simulate --sim-latency-scale 0.1      (sim_backend.py, --slots-per-chassis modules per chassis)
+#
+# Counts larger than the number of available modules are skipped. The first module is the master of mimoresync and
+# fastbranching.
+
+TESTS = ["helloworldmimo", "mimoresync", "fastbranching"]
+PHASES = ["build", "compile", "load"]
+DEFAULT_COUNTS = [2, 4, 8, 16, 32]
+DEFAULT_TOLERANCE = 0.15 # growth exponents above 1 + DEFAULT_TOLERANCE are flagged
+SIM_FIRST_SLOT = 2 # slot 1 holds the chassis controller
+
+
+def _location(text):
+    chassis, slot = text.split(",")
+    return [int(chassis), int(slot)]
+
+
+def sim_layout(count, slots_per_chassis=16, first_slot=SIM_FIRST_SLOT):
+    # {(CHASSIS, SLOT): PRODUCT NAME} with count M3202A modules, filling slots_per_chassis slots of each chassis in turn
+    return {(1 + index // slots_per_chassis, first_slot + index % slots_per_chassis): "M3202A" for index in range(count)}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build/compile/load time of the multi-engine tests against the number of modules")
+    parser.add_argument('--counts', help='Engine counts to measure', nargs='+', type=int, default=DEFAULT_COUNTS)
+    parser.add_argument('--tests', help='Tests to run', nargs='+', choices=TESTS, default=TESTS)
+    parser.add_argument('--repeat', help='Runs per test and count (the median is reported)', type=int, default=3)
+    parser.add_argument('--tolerance', help='Flag growth exponents above 1 + this value', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--modules', help='Module locations as chassis,slot (hardware)', nargs='+', type=_location, default=None)
+    parser.add_argument('--discover', help='Use every module found in the detected chassis (hardware)', action='store_true')
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--simulate', help='Run on the simulated keysightSD1/pyhvi backend (sim_backend.py)', action='store_true')
+    parser.add_argument('--sim-latency-scale', help='With --simulate, factor applied to every simulated latency', type=float, default=1.0)
+    parser.add_argument('--slots-per-chassis', help='With --simulate, modules installed per simulated chassis', type=int, default=16)
+    return parser.parse_args()
+
+
+# --simulate has to take effect before anything imports keysightSD1/pyhvi (see sim_backend.py)
+if __name__ == '__main__':
+    args = parse_args()
+    if args.simulate:
+        import sim_backend
+        sim_backend.install(sim_backend.LatencyModel(scale=args.sim_latency_scale),
+                            modules=sim_layout(max(args.counts), args.slots_per_chassis))
+
+from hvi_configurator import configure_hvi
+from hvi_cache import hvi_cache
+from module_pool import ModulePool
+from bench_phases import make_test
+from test_initialization import *
+
+
+def measure(test_key, module_dict, master_location, pool, repeat):
+    # Median seconds of each phase over repeat runs: {"build", "compile", "load"}
+    samples = {phase: [] for phase in PHASES}
+    for run in range(0, repeat):
+        hvi_cache.clear() # every run lowers and compiles a fresh KtHvi
+        test = make_test(test_key, module_dict, master_location, pool)
+
+        start = time.perf_counter()
+        configure_hvi(test)
+        samples["build"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        test.compile_hvi()
+        samples["compile"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        test.load_hvi()
+        samples["load"].append(time.perf_counter() - start)
+
+        test.release_hvi()
+        test.close_modules()
+    return {phase: statistics.median(values) for phase, values in samples.items()}
+
+
+def fit_growth(counts, seconds):
+    # Least-squares fit of seconds = coefficient * count^exponent. Returns (exponent, coefficient, r_squared)
+    x = numpy.log(numpy.asarray(counts, dtype=float))
+    y = numpy.log(numpy.maximum(numpy.asarray(seconds, dtype=float), 1e-9))
+    exponent, intercept = numpy.polyfit(x, y, 1)
+    residual = y - (exponent * x + intercept)
+    spread = numpy.sum((y - numpy.mean(y)) ** 2)
+    r_squared = 1.0 - numpy.sum(residual ** 2) / spread if spread > 0 else 1.0
+    return float(exponent), float(math.exp(intercept)), float(r_squared)
+
+
+def run_scaling(module_array, counts, tests=TESTS, repeat=3, tolerance=DEFAULT_TOLERANCE):
+    # Returns {"counts", "results": {test: {count: {phase: seconds}}}, "fits": {test: {phase: {...}}}}
+    skipped = sorted(set(count for count in counts if count > len(module_array)))
+    counts = sorted(set(count for count in counts if count <= len(module_array)))
+    if skipped:
+        print("[ERROR] bench_scaling.run_scaling: only {} modules available, skipping counts {}".format(len(module_array), skipped))
+
+    module_dict = create_module_inventory(module_array[:max(counts)] if counts else [])
+    pool = ModulePool(module_dict)
+    keys = list(module_dict) # module_dict keeps the module_array order
+    master_location = module_dict[keys[0]] if keys else None
+
+    results = {test_key: {} for test_key in tests}
+    for count in counts:
+        subset = {key: module_dict[key] for key in keys[:count]}
+        for test_key in tests:
+            results[test_key][count] = measure(test_key, subset, master_location, pool, repeat)
+            print("{:<16} {:>3} engines: ".format(test_key, count) + ", ".join(
+                "{} {:.4f} s".format(phase, results[test_key][count][phase]) for phase in PHASES))
+    pool.close()
+
+    fits = {}
+    for test_key in tests:
+        fits[test_key] = {}
+        measured = sorted(results[test_key])
+        if len(measured) < 2:
+            continue
+        for phase in PHASES:
+            seconds = [results[test_key][count][phase] for count in measured]
+            exponent, coefficient, r_squared = fit_growth(measured, seconds)
+            tail_exponent, _, _ = fit_growth(measured[-2:], seconds[-2:])
+            fits[test_key][phase] = {"exponent": exponent, "coefficient": coefficient, "r_squared": r_squared,
+                                     "tail_exponent": tail_exponent,
+                                     "super_linear": max(exponent, tail_exponent) > 1 + tolerance}
+    return {"counts": counts, "results": results, "fits": fits, "tolerance": tolerance}
+
+
+def print_scaling_report(report):
+    counts = report["counts"]
+    print("{:<16} {:<8} ".format("test", "phase") + " ".join("{:>10}".format("n={}".format(count)) for count in counts)
+          + "  {:>9} {:>6} {:>6}".format("exponent", "r2", "tail"))
+    for test_key, results in report["results"].items():
+        for phase in PHASES:
+            fit = report["fits"][test_key].get(phase)
+            line = "{:<16} {:<8} ".format(test_key, phase) + " ".join(
+                "{:>10.4f}".format(results[count][phase]) for count in counts)
+            if fit is not None:
+                line += "  {:>9.2f} {:>6.3f} {:>6.2f}".format(fit["exponent"], fit["r_squared"], fit["tail_exponent"])
+                if fit["super_linear"]:
+                    line += "  SUPER-LINEAR"
+            print(line)
+
+    flagged = ["{} {}".format(test_key, phase) for test_key, fits in report["fits"].items()
+               for phase, fit in fits.items() if fit["super_linear"]]
+    if flagged:
+        print("[ERROR] bench_scaling: super-linear growth (exponent > {:.2f}) in {}".format(1 + report["tolerance"], ", ".join(flagged)))
+    else:
+        print("All phases grow at most linearly with the number of engines (exponent <= {:.2f})".format(1 + report["tolerance"]))
+
+
+if __name__ == '__main__':
+    if args.simulate:
+        module_array = [list(location) for location in sim_backend.platform.locations()]
+        module_array.sort(key=lambda location: (location[0], location[1]))
+    elif args.discover:
+        module_array = [list(location) for location in discover_modules().values()]
+    else:
+        module_array = args.modules or [[1, 7], [1, 10]]
+
+    report = run_scaling(module_array, args.counts, args.tests, args.repeat, args.tolerance)
+    print_scaling_report(report)
+    if args.simulate:
+        print(sim_backend.latency.report())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"counts": report["counts"], "tolerance": report["tolerance"], "fits": report["fits"],
+                       "results": {test_key: {str(count): phases for count, phases in results.items()}
+                                   for test_key, results in report["results"].items()}}, f, indent=2)
+        print("Results written to {}".format(args.json))
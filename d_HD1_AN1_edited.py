@@ -4,6 +4,7 @@ import pyhvi
 sys.path.append('C:\Program Files (x86)\Keysight\SD1\Libraries\Python')
 import keysightSD1
 import argparse
+from waveform_file import sd_wave_from_file
 from datetime import timedelta
 
 """HVI Multi-Channel Sync Playback example
@@ -73,9 +74,10 @@ def awgQueueWaveform(moduleAOU):
 	
 	#Load waveform to AWG memory
 	moduleAOU.waveformFlush() #memory flush
-	wave = keysightSD1.SD_Wave()
 	wfmNum = 0
-	wave.newFromFile("C:/Users/Public/Documents/Keysight/SD1/Examples/Waveforms/Gaussian.csv")
+	wave, error = sd_wave_from_file("C:/Users/Public/Documents/Keysight/SD1/Examples/Waveforms/Gaussian.csv") #converted once, memory-mapped afterwards
+	if error < 0:
+		raise Exception("Could not read Gaussian.csv (error {})".format(error))
 	moduleAOU.waveformLoad(wave, wfmNum)
 
 	for nAWG in range(CHmin, CHmin+nChannels):
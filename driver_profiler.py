@@ -0,0 +1,214 @@
+import sys
+sys.path.append('C:/Program Files (x86)/Keysight/SD1/Libraries/Python')
+import enum
+import functools
+import os
+import threading
+import time
+from datetime import timedelta
+import keysightSD1
+import pyhvi
+
+# Driver call profiler.
+#
+# Counts every keysightSD1 module call (SD_AOU/SD_AIN methods) and every pyhvi call the bench makes, with the total and
+# maximum time spent in each, so the cost of e.g. the set_parameter calls of hvi_configurator.lower_sequence shows up
+# next to the waveform and register traffic. Nothing is wrapped until install() is called:
+#
+#   driver_profiler.install()          # before the tests run
+#   ...
+#   print(driver_profiler.report(20))  # top 20 calls by total time
+#   driver_profiler.uninstall()
+#
+# or "python test_bench.py --profile-drivers 20" (add --profile-call-sites for call_sites=True).
+#
+# install() replaces the public methods of the SD1 module classes with timing wrappers, so modules that are already
+# open are profiled as well. pyhvi objects are reached from the KtHvi instance, so pyhvi.KtHvi is replaced by a
+# factory that returns a proxy of the new instance; every object obtained through the proxy (engines, sequences,
+# registers, instructions, ...) is proxied in turn and every method called on one of them is timed. Only KtHvi
+# instances created after install() are profiled. Calls are keyed by "<class>.<method>"; with call_sites=True the
+# bench file and line that made the call are added to the key.
+#
+# With the profiler installed but disabled (driver_profiler.enabled = False) the wrappers only check the flag.
+
+# SD1 classes whose methods are wrapped
+SD1_CLASSES = ("SD_AOU", "SD_AIN")
+
+# Values returned by pyhvi calls that are passed through as they are instead of being proxied. Lists, tuples and dicts
+# are copied with their elements proxied, so pyhvi objects handed out in a container are profiled too
+_PLAIN_TYPES = (int, float, complex, str, bytes, bool, type(None), enum.Enum, timedelta)
+
+
+def _unwrap(value):
+    # Arguments handed to pyhvi must be the real objects, not their proxies
+    if isinstance(value, _HviProxy):
+        return object.__getattribute__(value, "_target")
+    if type(value) in (list, tuple):
+        return type(value)(_unwrap(item) for item in value)
+    if type(value) is dict:
+        return {key: _unwrap(item) for key, item in value.items()}
+    return value
+
+
+class _HviProxy:
+    # Stands in for a pyhvi object: attribute reads return proxies or timed methods, everything else is forwarded
+
+    __slots__ = ("_target", "_profiler")
+
+    def __init__(self, target, profiler):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_profiler", profiler)
+
+    def __getattr__(self, name):
+        target = object.__getattribute__(self, "_target")
+        profiler = object.__getattribute__(self, "_profiler")
+        value = getattr(target, name)
+        if callable(value) and not isinstance(value, (type, _HviProxy)):
+            return profiler._timed_hvi_call("{}.{}".format(type(target).__name__, name), value)
+        return profiler._proxy(value)
+
+    def __setattr__(self, name, value):
+        setattr(object.__getattribute__(self, "_target"), name, _unwrap(value))
+
+    def __getitem__(self, key):
+        target = object.__getattribute__(self, "_target")
+        return object.__getattribute__(self, "_profiler")._proxy(target[_unwrap(key)])
+
+    def __iter__(self):
+        profiler = object.__getattribute__(self, "_profiler")
+        return (profiler._proxy(item) for item in object.__getattribute__(self, "_target"))
+
+    def __len__(self):
+        return len(object.__getattribute__(self, "_target"))
+
+    def __bool__(self):
+        return bool(object.__getattribute__(self, "_target"))
+
+    def __eq__(self, other):
+        return object.__getattribute__(self, "_target") == _unwrap(other)
+
+    def __hash__(self):
+        return hash(object.__getattribute__(self, "_target"))
+
+    def __repr__(self):
+        return repr(object.__getattribute__(self, "_target"))
+
+    def __str__(self):
+        return str(object.__getattribute__(self, "_target"))
+
+
+class DriverProfiler:
+
+    def __init__(self):
+        self.enabled = False
+        self.installed = False
+        self.call_sites = False
+        self.stats = {} # FORMAT: {CALL KEY: [CALLS, TOTAL SECONDS, MAX SECONDS]}
+        self._originals = [] # FORMAT: [(OWNER, ATTRIBUTE, ORIGINAL VALUE or None if it was inherited)]
+        self._lock = threading.Lock() # calls are made from the module open/config and compile thread pools
+
+    def install(self, call_sites=False, sd1_classes=SD1_CLASSES):
+        if self.installed:
+            return
+        self.call_sites = call_sites
+        for class_name in sd1_classes:
+            cls = getattr(keysightSD1, class_name)
+            wrapped = set()
+            for klass in cls.__mro__[:-1]: # everything but object
+                for name, function in list(vars(klass).items()):
+                    if name.startswith("_") or name in wrapped or not callable(function) or isinstance(function, type):
+                        continue
+                    if isinstance(function, (staticmethod, classmethod, property)):
+                        continue
+                    wrapped.add(name)
+                    self._originals.append((cls, name, vars(cls).get(name)))
+                    setattr(cls, name, self._timed_method("{}.{}".format(class_name, name), function))
+
+        KtHvi = pyhvi.KtHvi
+        profiler = self
+        @functools.wraps(KtHvi)
+        def profiled_KtHvi(*args, **kwargs):
+            return profiler._proxy(profiler._call("KtHvi()", KtHvi, args, kwargs))
+        self._originals.append((pyhvi, "KtHvi", KtHvi))
+        pyhvi.KtHvi = profiled_KtHvi
+
+        self.installed = True
+        self.enabled = True
+
+    def uninstall(self):
+        # Puts the original methods back. Proxies handed out before stay valid but keep counting while enabled
+        for owner, name, original in reversed(self._originals):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._originals = []
+        self.installed = False
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+
+    def _call(self, key, function, args, kwargs):
+        if not self.enabled:
+            return function(*args, **kwargs)
+        if self.call_sites:
+            caller = sys._getframe(2)
+            key = "{} @ {}:{}".format(key, os.path.basename(caller.f_code.co_filename), caller.f_lineno)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                entry = self.stats.get(key)
+                if entry is None:
+                    self.stats[key] = [1, elapsed, elapsed]
+                else:
+                    entry[0] += 1
+                    entry[1] += elapsed
+                    if elapsed > entry[2]:
+                        entry[2] = elapsed
+
+    def _timed_method(self, key, function):
+        profiler = self
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            return profiler._call(key, function, args, kwargs)
+        return wrapper
+
+    def _timed_hvi_call(self, key, method):
+        profiler = self
+        def wrapper(*args, **kwargs):
+            return profiler._proxy(profiler._call(key, method, _unwrap(args), {name: _unwrap(value) for name, value in kwargs.items()}))
+        return wrapper
+
+    def _proxy(self, value):
+        if isinstance(value, _PLAIN_TYPES) or isinstance(value, (_HviProxy, type)):
+            return value
+        if type(value) in (list, tuple):
+            return type(value)(self._proxy(item) for item in value)
+        if type(value) is dict:
+            return {key: self._proxy(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple, dict)):
+            return value # subclasses (e.g. namedtuples) are passed through
+        return _HviProxy(value, self)
+
+    def report(self, top=20):
+        with self._lock:
+            stats = dict(self.stats)
+        if not stats:
+            return "Driver calls: none recorded"
+        calls = sum(entry[0] for entry in stats.values())
+        total = sum(entry[1] for entry in stats.values())
+        lines = ["Driver calls: {} calls to {} entry points, {:.3f} s in the drivers (top {} by total time)".format(calls, len(stats), total, top)]
+        lines.append("  {:<56} {:>8} {:>11} {:>11} {:>11}".format("call", "calls", "total ms", "mean us", "max us"))
+        for key in sorted(stats, key=lambda key: stats[key][1], reverse=True)[:top]:
+            count, seconds, longest = stats[key]
+            lines.append("  {:<56} {:>8} {:>11.3f} {:>11.1f} {:>11.1f}".format(key, count, 1e3 * seconds, 1e6 * seconds / count, 1e6 * longest))
+        return "\n".join(lines)
+
+
+# Profiler shared by the whole session
+driver_profiler = DriverProfiler()
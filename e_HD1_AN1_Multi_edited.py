@@ -4,6 +4,8 @@ import pyhvi
 sys.path.append('C:\Program Files (x86)\Keysight\SD1\Libraries\Python')
 import keysightSD1
 import argparse
+from waveform_file import sd_wave_from_file
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 
 """HVI Multi-Channel Sync Playback example
@@ -52,7 +54,16 @@ compiles and runs.
 	 +-------+		  +-------+	 
 """
 
+def check(errors, call, error):
+	#Records a negative driver return code as (call, error)
+	if isinstance(error, int) and error < 0:
+		errors.append((call, error))
+	return error
+
 def awgQueueWaveform(moduleAOU):
+	#Configures one module and returns the list of (call, error code) that failed. Every module is independent, so
+	#main() runs this for all modules at the same time; the calls for one module keep their order
+	errors = []
 	
 	#AWG Channel Variables
 	nChannels = 2
@@ -72,30 +83,31 @@ def awgQueueWaveform(moduleAOU):
 	triggerMode = keysightSD1.SD_TriggerModes.SWHVITRIG_CYCLE
 	
 	#Load waveform to AWG memory
-	moduleAOU.waveformFlush() #memory flush
-	wave = keysightSD1.SD_Wave()
+	check(errors, "waveformFlush", moduleAOU.waveformFlush()) #memory flush
 	wfmNum = 0
-	wave.newFromFile("C:/Users/Public/Documents/Keysight/SD1/Examples/Waveforms/Gaussian.csv")
-	moduleAOU.waveformLoad(wave, wfmNum)
+	wave, error = sd_wave_from_file("C:/Users/Public/Documents/Keysight/SD1/Examples/Waveforms/Gaussian.csv") #converted once, memory-mapped afterwards
+	check(errors, "sd_wave_from_file", error)
+	check(errors, "waveformLoad", moduleAOU.waveformLoad(wave, wfmNum))
 
 	for nAWG in range(CHmin, CHmin+nChannels):
 		#AWG queue flush 
-		moduleAOU.AWGstop(nAWG)
-		moduleAOU.AWGflush(nAWG)
+		check(errors, f"AWGstop({nAWG})", moduleAOU.AWGstop(nAWG))
+		check(errors, f"AWGflush({nAWG})", moduleAOU.AWGflush(nAWG))
 
 		#Set AWG mode
 		amplitude = 1
-		moduleAOU.channelWaveShape(nAWG, keysightSD1.SD_Waveshapes.AOU_AWG)
-		moduleAOU.channelAmplitude(nAWG, amplitude)
+		check(errors, f"channelWaveShape({nAWG})", moduleAOU.channelWaveShape(nAWG, keysightSD1.SD_Waveshapes.AOU_AWG))
+		check(errors, f"channelAmplitude({nAWG})", moduleAOU.channelAmplitude(nAWG, amplitude))
 		
 		#AWG configuration
-		moduleAOU.AWGqueueConfig(nAWG, queueMode)
-		moduleAOU.AWGqueueSyncMode(nAWG, syncMode)
+		check(errors, f"AWGqueueConfig({nAWG})", moduleAOU.AWGqueueConfig(nAWG, queueMode))
+		check(errors, f"AWGqueueSyncMode({nAWG})", moduleAOU.AWGqueueSyncMode(nAWG, syncMode))
 		
 		#Queue waveform to channel nAWG
-		moduleAOU.AWGqueueWaveform(nAWG, wfmNum, triggerMode, startDelay, nCycles, prescaler)
-		moduleAOU.AWGstart(nAWG) #AWG starts and wait for trigger
-		moduleAOU.AWGtrigger(nAWG) #AWG trigger to output a first waveform before the HVI loop
+		check(errors, f"AWGqueueWaveform({nAWG})", moduleAOU.AWGqueueWaveform(nAWG, wfmNum, triggerMode, startDelay, nCycles, prescaler))
+		check(errors, f"AWGstart({nAWG})", moduleAOU.AWGstart(nAWG)) #AWG starts and wait for trigger
+		check(errors, f"AWGtrigger({nAWG})", moduleAOU.AWGtrigger(nAWG)) #AWG trigger to output a first waveform before the HVI loop
+	return errors
 	
 def parse_args():
 	parser = argparse.ArgumentParser()
@@ -139,9 +151,12 @@ def main():
 			module_list.append(module)
 			nModules +=1
 		
-		# Queue AWG Waveforms
-		for index in range(0, nModules):
-			awgQueueWaveform(module_list[index])
+		# Queue AWG Waveforms on all modules at the same time and report every failed call at once
+		with ThreadPoolExecutor(max_workers=max(1, nModules)) as pool:
+			module_errors = list(pool.map(awgQueueWaveform, module_list))
+		failed = [(descriptor, errors) for descriptor, errors in zip(module_descriptors, module_errors) if errors]
+		for descriptor, errors in failed:
+			print(f"Module in chassis {descriptor['chassis_number']}, slot {descriptor['slot_number']}: " + ", ".join(f"{call} returned {error}" for call, error in errors))
 
 		# Obtain SD_AOUHvi interface from modules
 		module_hvi_list = []
@@ -1,19 +1,26 @@
 import sys
 sys.path.append('C:/Program Files (x86)/Keysight/SD1/Libraries/Python')
 import keysightSD1
+import numpy
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from waveform_cache import waveform_residency
+from waveform_table import WaveformTable
+from tracing import tracer
 
 # This is a switch that will route the top-level script to the correct function to configure the test's hardware
 def configure_hardware(Test_obj):
-    if Test_obj.test_key == "helloworld":
-        _helloworld_hw_config(Test_obj)
-    elif Test_obj.test_key == "helloworldmimo":
-        _helloworldmimo_hw_config(Test_obj)
-    elif Test_obj.test_key == "mimoresync":
-        _mimo_resync_hw_config(Test_obj)
-    elif Test_obj.test_key == "fastbranching":
-        _fast_branching_hw_config(Test_obj)
-    else:
-        print("[ERROR] hardware_configurator.configure_hardware: Test object's test_key variable did not match a valid key")
+    with tracer.span("configure_hardware", test=Test_obj.test_key):
+        if Test_obj.test_key == "helloworld":
+            _helloworld_hw_config(Test_obj)
+        elif Test_obj.test_key == "helloworldmimo":
+            _helloworldmimo_hw_config(Test_obj)
+        elif Test_obj.test_key == "mimoresync":
+            _mimo_resync_hw_config(Test_obj)
+        elif Test_obj.test_key == "fastbranching":
+            _fast_branching_hw_config(Test_obj)
+        else:
+            print("[ERROR] hardware_configurator.configure_hardware: Test object's test_key variable did not match a valid key")
 
 # This is the hardware configurator for the helloworld test
 def _helloworld_hw_config(Test_obj):
@@ -25,69 +32,98 @@ def _helloworldmimo_hw_config(Test_obj):
 def _mimo_resync_hw_config(Test_obj):
     print("No special AWG configuration need for mimo resync test.")
 
-def _fast_branching_hw_config(Test_obj):
+# Modules are configured on a thread pool of this size; their driver calls are independent of each other
+HW_CONFIG_WORKERS = 8
 
-    # Need to configure each module in the test
-    for module_inst in Test_obj.module_instances:
-        moduleAOU = module_inst[0]
+def _check(errors, call, error):
+    # Records a negative driver return code as (call, error) and passes the code through
+    if isinstance(error, int) and error < 0:
+        errors.append((call, error))
+    return error
 
-        # AWG Settings Variables
-        hwVer = moduleAOU.getHardwareVersion()
-        if hwVer < 4:
-            nAWG = 0
-        else:
-            nAWG = 1
-
-        # AWG reset
-        moduleAOU.AWGstop(nAWG)
-        moduleAOU.waveformFlush()
-        moduleAOU.AWGflush(nAWG)
-
-        # Set AWG mode
-        amplitude = 1.0
-        moduleAOU.channelWaveShape(nAWG, keysightSD1.SD_Waveshapes.AOU_AWG)
-        moduleAOU.channelAmplitude(nAWG, amplitude)
-
-        # Queue settings
-        syncMode = keysightSD1.SD_SyncModes.SYNC_NONE
-        queueMode = keysightSD1.SD_QueueMode.ONE_SHOT
-        moduleAOU.AWGqueueConfig(nAWG, queueMode)
-        moduleAOU.AWGqueueSyncMode(nAWG, syncMode)
-
-        # Create a pulsed waveform
-        wfmType = keysightSD1.SD_WaveformTypes.WAVE_ANALOG
-        wfmLen = 200
-        wfmNum = 1
-        wfmNum1 = 2
-        onTime = 50
-        wfmData = []
-        for ii in range(0, wfmLen):
-            value = 0.0
-            if ii < onTime:
-                value = 1.0
-
-            wfmData.append(value)
-
-        wave = keysightSD1.SD_Wave()
-        wave.newFromArrayDouble(wfmType, wfmData)
-        error = moduleAOU.waveformLoad(wave, wfmNum)
-        if (error < 0):
-            print("WaveformLoad0 error ", error)
-
-        # Create a ramp waveform
-        wfmData1 = []
-        for ii in range(0, wfmLen):
-            value = 0.0
-            if ii < onTime:
-                value = float(ii) / onTime
-
-            wfmData1.append(value)
-
-        wave1 = keysightSD1.SD_Wave()
-        wave1.newFromArrayDouble(wfmType, wfmData1)
-        error = moduleAOU.waveformLoad(wave1, wfmNum1)
-        if (error < 0):
-            print("WaveformLoad1 error ", error)
-
-        moduleAOU.AWGstart(nAWG)
+def _fast_branching_hw_config(Test_obj):
 
+    residency_before = waveform_residency.snapshot()
+
+    # Need to configure each module in the test. Each module's setup runs on its own worker in the usual order; the
+    # negative return codes of all modules are collected into one report
+    module_instances = Test_obj.module_instances
+    table = Test_obj.waveform_table
+    with ThreadPoolExecutor(max_workers=max(1, min(HW_CONFIG_WORKERS, len(module_instances)))) as pool:
+        module_errors = list(pool.map(lambda module_inst: _traced_fast_branching_module_config(module_inst, table), module_instances))
+
+    Test_obj.hw_config_errors = {}
+    for module_inst, errors in zip(Test_obj.module_instances, module_errors):
+        if errors:
+            Test_obj.hw_config_errors[module_inst[1]] = errors
+    for name, errors in Test_obj.hw_config_errors.items():
+        print("[ERROR] hardware_configurator._fast_branching_hw_config: {}: {}".format(
+            name, ", ".join("{} returned {}".format(call, error) for call, error in errors)))
+
+    Test_obj.waveform_report = waveform_residency.report(since=residency_before)
+    print(Test_obj.waveform_report)
+
+def _traced_fast_branching_module_config(module_inst, table):
+    with tracer.span("configure_module", cat="module", module=module_inst[1], waveforms=len(table)) as span:
+        errors = _fast_branching_module_config(module_inst[0], table)
+        span.set(errors=len(errors))
+    return errors
+
+def _fast_branching_module_config(moduleAOU, table):
+    # Configures one module for the fast branching test and loads the waveforms of table (a WaveformTable). Returns the
+    # list of (call, error code) that failed
+    errors = []
+
+    # AWG Settings Variables
+    hwVer = moduleAOU.getHardwareVersion()
+    if hwVer < 4:
+        nAWG = 0
+    else:
+        nAWG = 1
+
+    # AWG reset. The AWG memory is only flushed the first time a module is seen (see waveform_cache.py)
+    _check(errors, "AWGstop", moduleAOU.AWGstop(nAWG))
+    _check(errors, "AWGflush", moduleAOU.AWGflush(nAWG))
+    if not waveform_residency.is_tracked(moduleAOU):
+        _check(errors, "waveformFlush", waveform_residency.flush(moduleAOU))
+
+    # Set AWG mode
+    amplitude = 1.0
+    _check(errors, "channelWaveShape", moduleAOU.channelWaveShape(nAWG, keysightSD1.SD_Waveshapes.AOU_AWG))
+    _check(errors, "channelAmplitude", moduleAOU.channelAmplitude(nAWG, amplitude))
+
+    # Queue settings
+    syncMode = keysightSD1.SD_SyncModes.SYNC_NONE
+    queueMode = keysightSD1.SD_QueueMode.ONE_SHOT
+    _check(errors, "AWGqueueConfig", moduleAOU.AWGqueueConfig(nAWG, queueMode))
+    _check(errors, "AWGqueueSyncMode", moduleAOU.AWGqueueSyncMode(nAWG, syncMode))
+
+    # Load the waveform table (built once and shared by every module). Waveforms that are already resident in this
+    # module's AWG memory are not uploaded again
+    errors.extend(table.load(moduleAOU))
+
+    _check(errors, "AWGstart", moduleAOU.AWGstart(nAWG))
+    return errors
+
+
+# Fast branching waveforms: a pulse (1.0 for the first onTime samples, then 0.0) and a ramp (0.0 to 1.0 over the first
+# onTime samples, then 0.0)
+FAST_BRANCHING_WFM_LEN = 200
+FAST_BRANCHING_ON_TIME = 50
+
+@lru_cache(maxsize=None)
+def fast_branching_waveforms(wfmLen=FAST_BRANCHING_WFM_LEN, onTime=FAST_BRANCHING_ON_TIME):
+    # Returns the (pulse, ramp) sample arrays. They are computed once per length and shared, so they are read-only
+    samples = numpy.arange(wfmLen, dtype=numpy.float64)
+    on = samples < onTime
+    pulse = numpy.where(on, 1.0, 0.0)
+    ramp = numpy.where(on, samples / onTime, 0.0)
+    for data in (pulse, ramp):
+        data.flags.writeable = False
+    return pulse, ramp
+
+@lru_cache(maxsize=None)
+def fast_branching_table(wfmLen=FAST_BRANCHING_WFM_LEN, onTime=FAST_BRANCHING_ON_TIME):
+    # The default fast branching WaveformTable: the pulse as waveform 1 and the ramp as waveform 2, created once per
+    # session and loaded into every module
+    return WaveformTable(fast_branching_waveforms(wfmLen, onTime), names=["pulse", "ramp"])
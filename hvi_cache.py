@@ -0,0 +1,74 @@
+import threading
+import time
+import weakref
+
+# Session cache of compiled KtHvi instances.
+#
+# Compiling an HVI instance is expensive and its result only depends on the sequence definition and on the modules the
+# engines run on. The configurators look the sequence up here before lowering it (see hvi_configurator._lower_cached),
+# and the tests compile through HviCache.compile(), so running the same sequence again on the same modules reuses the
+# KtHvi instance that was already compiled instead of building and compiling a new one.
+#
+# The key is (HviSequence.fingerprint(), ids of the module objects). The fingerprint covers the whole sequence
+# definition, including the engine/module locations and the sync resources. The module object ids tie an entry to the
+# open module handles it was built on (the entry keeps references to them, so the ids are never reused): reopening the
+# modules, as Test.__init__ does without a ModulePool, always misses.
+#
+# A test may compile its instance ahead of time (Test.compile_hvi, bench_pipeline.py) and again in run_hvi(). Only a
+# compile skipped for a test other than the one the entry was last compiled or reused for counts as a hit.
+
+
+class HviCache:
+
+    def __init__(self):
+        # FORMAT: {KEY: {"hvi": KtHvi, "modules": [INSTANCE, ...], "compile_time": SECONDS or None, "owner": TEST WEAKREF or None}}
+        self.entries = {}
+        self.hits = 0 # compiles skipped
+        self.misses = 0 # compiles run
+        self.compile_time_saved = 0.0 # sum of the recorded compile time of every skipped compile
+        self._lock = threading.Lock() # compile() may be called from several threads (test_helloworld.concurrent_hvi)
+
+    def key(self, sequence, module_instances):
+        return sequence.fingerprint(), tuple(id(module_inst[0]) for module_inst in module_instances)
+
+    def lookup(self, key):
+        entry = self.entries.get(key)
+        return entry["hvi"] if entry is not None else None
+
+    def add(self, key, hvi, module_instances):
+        self.entries[key] = {"hvi": hvi, "modules": [module_inst[0] for module_inst in module_instances], "compile_time": None,
+                             "owner": None}
+
+    def compile(self, hvi, key=None, owner=None):
+        # Compiles hvi unless it is the cached instance for key and has been compiled already. Returns True if the
+        # compile was skipped. owner is the Test compiling it: skipping a compile the same test already ran or reused
+        # is not a hit
+        entry = self.entries.get(key) if key is not None else None
+        if entry is not None and entry["hvi"] is hvi and entry["compile_time"] is not None:
+            with self._lock:
+                if owner is None or entry["owner"] is None or entry["owner"]() is not owner:
+                    self.hits += 1
+                    self.compile_time_saved += entry["compile_time"]
+                    entry["owner"] = weakref.ref(owner) if owner is not None else None
+            return True
+
+        start = time.perf_counter()
+        hvi.compile()
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.misses += 1
+        if entry is not None and entry["hvi"] is hvi:
+            entry["compile_time"] = elapsed
+            entry["owner"] = weakref.ref(owner) if owner is not None else None
+        return False
+
+    def clear(self):
+        self.entries = {}
+
+    def report(self):
+        return "HVI compile cache: {} hits, {} misses, {:.3f} s of compile time saved".format(self.hits, self.misses, self.compile_time_saved)
+
+
+# Cache shared by the configurators and the tests for the whole session
+hvi_cache = HviCache()
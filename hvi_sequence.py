@@ -0,0 +1,376 @@
+from collections import namedtuple
+import hashlib
+
+# Hardware-independent description of an HVI instance (engines, triggers, events, registers, actions and the program).
+#
+# Nothing in this file touches keysightSD1 or pyhvi: a sequence can be built, validated and fingerprinted offline in
+# microseconds. hvi_configurator.lower_sequence() is the single pass that turns an HviSequence into a pyhvi.KtHvi.
+#
+# Driver enums are written symbolically and resolved when the sequence is lowered:
+#   hvi_const("SyncMode", "IMMEDIATE")        -> pyhvi.SyncMode.IMMEDIATE
+#   sd1_const("SD_TriggerModes", "SWHVITRIG")  -> keysightSD1.SD_TriggerModes.SWHVITRIG
+# Resources of an engine are referenced by name (TriggerRef, EventRef, RegisterRef, ActionRef) and resolved against the
+# engine the statement runs on. Module resources (trigger/event/action sources, the engine itself) are attribute names
+# on the module's SD_AOUHvi interface, e.g. "front_panel_1", "pxi_2", "awg1_trigger", "main_engine".
+
+
+class SequenceError(Exception):
+    pass
+
+
+Const = namedtuple("Const", ["namespace", "type_name", "member"])
+
+
+def hvi_const(type_name, member):
+    return Const("pyhvi", type_name, member)
+
+
+def sd1_const(type_name, member):
+    return Const("keysightSD1", type_name, member)
+
+
+TriggerRef = namedtuple("TriggerRef", ["name"])
+EventRef = namedtuple("EventRef", ["name"])
+RegisterRef = namedtuple("RegisterRef", ["name"])
+ActionRef = namedtuple("ActionRef", ["name"])
+
+# Engine resources
+TriggerDef = namedtuple("TriggerDef", ["name", "source", "configuration"]) # configuration: ((attribute, value), ...)
+EventDef = namedtuple("EventDef", ["name", "source"])
+RegisterDef = namedtuple("RegisterDef", ["name", "size"])
+ActionDef = namedtuple("ActionDef", ["name", "source"])
+
+# Statements, kept in program order. Instruction and WaitEvent run on one engine, the others on all engines
+#   Instruction.scope is "hvi" for KtHvi instructions (hvi.instructions.<instruction>) and "module" for instrument
+#   instructions (module.hvi.instructions.<instruction>)
+Instruction = namedtuple("Instruction", ["engine", "name", "time", "scope", "instruction", "parameters"])
+WaitEvent = namedtuple("WaitEvent", ["engine", "name", "time", "event", "detection", "sync"])
+Junction = namedtuple("Junction", ["name", "time"])
+Jump = namedtuple("Jump", ["name", "time", "destination"])
+End = namedtuple("End", ["name", "time"])
+
+START = "Start" # implicit first statement of every sequence, valid as a jump destination
+
+
+class _EngineResources:
+    # Triggers, events, registers and actions of an engine (or of an EngineTemplate)
+
+    def __init__(self):
+        self.triggers = []
+        self.events = []
+        self.registers = []
+        self.actions = []
+
+    def add_trigger(self, name, source, **configuration):
+        self.triggers.append(TriggerDef(name, source, tuple(configuration.items())))
+        return TriggerRef(name)
+
+    def add_event(self, name, source):
+        self.events.append(EventDef(name, source))
+        return EventRef(name)
+
+    def add_register(self, name, size=hvi_const("RegisterSize", "SHORT")):
+        self.registers.append(RegisterDef(name, size))
+        return RegisterRef(name)
+
+    def add_action(self, name, source):
+        self.actions.append(ActionDef(name, source))
+        return ActionRef(name)
+
+
+class EngineDef(_EngineResources):
+
+    def __init__(self, name, location, engine="main_engine"):
+        super().__init__()
+        self.name = name
+        self.location = list(location) # [chassis, slot] of the module the engine belongs to
+        self.engine = engine
+
+    def canonical(self):
+        return (self.name, tuple(self.location), self.engine, tuple(self.triggers), tuple(self.events),
+                tuple(self.registers), tuple(self.actions))
+
+
+class EngineTemplate(_EngineResources):
+    # The per-engine part of a multi-engine sequence, defined once and stamped onto every engine with
+    # HviSequence.stamp(). Resources are added like on an EngineDef; instructions are Instruction statements without
+    # an engine, which stamp() fills in
+
+    def __init__(self):
+        super().__init__()
+        self.instructions = []
+
+    def add_instruction(self, name, time, instruction, parameters, scope="hvi"):
+        self.instructions.append(Instruction(None, name, time, scope, instruction, tuple(parameters)))
+
+
+class HviSequence:
+
+    def __init__(self, name="KtHvi"):
+        self.name = name
+        self.engines = []
+        self.statements = []
+        self.sync_resources = [] # hvi_const("TriggerResourceId", ...)
+        self.non_hvi_core_clocks = []
+        self.auto_detect_chassis = False
+
+    def add_engine(self, name, location, engine="main_engine"):
+        engine_def = EngineDef(name, location, engine)
+        self.engines.append(engine_def)
+        return engine_def
+
+    def engine(self, name):
+        for engine_def in self.engines:
+            if engine_def.name == name:
+                return engine_def
+        raise SequenceError("No engine named {}".format(name))
+
+    def add_instruction(self, engine, name, time, instruction, parameters, scope="hvi"):
+        self.statements.append(Instruction(engine, name, time, scope, instruction, tuple(parameters)))
+
+    def stamp(self, template, engines=None):
+        # Gives each engine in engines (default: every engine) the resources and instructions of template. The
+        # instructions are appended engine by engine, at the current end of the program
+        for engine_def in self.engines if engines is None else engines:
+            engine_def.triggers.extend(template.triggers)
+            engine_def.events.extend(template.events)
+            engine_def.registers.extend(template.registers)
+            engine_def.actions.extend(template.actions)
+            self.statements.extend(instruction._replace(engine=engine_def.name) for instruction in template.instructions)
+
+    def add_wait_event(self, engine, name, time, event, detection, sync=hvi_const("SyncMode", "IMMEDIATE")):
+        self.statements.append(WaitEvent(engine, name, time, event, detection, sync))
+
+    def add_junction(self, name, time):
+        self.statements.append(Junction(name, time))
+
+    def add_jump(self, name, time, destination=START):
+        self.statements.append(Jump(name, time, destination))
+
+    def add_end(self, name, time):
+        self.statements.append(End(name, time))
+
+    def instruction_count(self):
+        # Number of statements as they end up in the compiled sequences (global statements count once per engine)
+        count = 0
+        for statement in self.statements:
+            count += 1 if isinstance(statement, (Instruction, WaitEvent)) else len(self.engines)
+        return count
+
+    def canonical(self):
+        # Plain nested tuples describing the whole sequence, suitable for hashing and comparison
+        parameters = lambda statement: tuple((p, tuple(v) if isinstance(v, list) else v) for p, v in statement.parameters)
+        statements = tuple(statement._replace(parameters=parameters(statement)) if isinstance(statement, Instruction) else statement
+                           for statement in self.statements)
+        return ("HviSequence", self.name, tuple(engine_def.canonical() for engine_def in self.engines), statements,
+                tuple(self.sync_resources), tuple(self.non_hvi_core_clocks), self.auto_detect_chassis)
+
+    def fingerprint(self):
+        # Stable digest of the sequence definition, including the module locations and sync resources
+        return hashlib.sha256(repr(self.canonical()).encode("utf-8")).hexdigest()
+
+    def validate(self):
+        # Raises SequenceError listing every problem found, otherwise returns the sequence
+        errors = []
+
+        if not self.engines:
+            errors.append("sequence has no engines")
+        engines = {}
+        locations = set()
+        for engine_def in self.engines:
+            if engine_def.name in engines:
+                errors.append("duplicate engine name {}".format(engine_def.name))
+            engines[engine_def.name] = engine_def
+            if tuple(engine_def.location) in locations:
+                errors.append("two engines on the module in chassis {}, slot {}".format(*engine_def.location))
+            locations.add(tuple(engine_def.location))
+            for kind in ("triggers", "events", "registers", "actions"):
+                names = [resource.name for resource in getattr(engine_def, kind)]
+                for name in set(names):
+                    if names.count(name) > 1:
+                        errors.append("engine {} declares {} {} more than once".format(engine_def.name, kind[:-1], name))
+
+        def check_reference(engine_def, statement, value):
+            if isinstance(value, (list, tuple)) and not isinstance(value, (Const, TriggerRef, EventRef, RegisterRef, ActionRef)):
+                for item in value:
+                    check_reference(engine_def, statement, item)
+                return
+            for ref_type, kind in ((TriggerRef, "triggers"), (EventRef, "events"), (RegisterRef, "registers"), (ActionRef, "actions")):
+                if isinstance(value, ref_type) and value.name not in [resource.name for resource in getattr(engine_def, kind)]:
+                    errors.append("{} on engine {} uses undeclared {} {}".format(statement.name, engine_def.name, kind[:-1], value.name))
+
+        statement_names = {name: set() for name in engines}
+        global_names = set()
+        for statement in self.statements:
+            if statement.time < 0:
+                errors.append("{} has a negative time".format(statement.name))
+            if isinstance(statement, (Instruction, WaitEvent)):
+                if statement.engine not in engines:
+                    errors.append("{} runs on unknown engine {}".format(statement.name, statement.engine))
+                    continue
+                targets = [statement.engine]
+            else:
+                targets = list(engines)
+                global_names.add(statement.name)
+            for target in targets:
+                if statement.name in statement_names[target]:
+                    errors.append("statement name {} is used twice on engine {}".format(statement.name, target))
+                statement_names[target].add(statement.name)
+
+            if isinstance(statement, Instruction):
+                if statement.scope not in ("hvi", "module"):
+                    errors.append("{} has unknown instruction scope {}".format(statement.name, statement.scope))
+                for parameter, value in statement.parameters:
+                    check_reference(engines[statement.engine], statement, value)
+            elif isinstance(statement, WaitEvent):
+                check_reference(engines[statement.engine], statement, EventRef(statement.event))
+
+        for statement in self.statements:
+            if isinstance(statement, Jump) and statement.destination != START and statement.destination not in global_names:
+                errors.append("{} jumps to unknown statement {}".format(statement.name, statement.destination))
+        if not self.statements or not isinstance(self.statements[-1], End):
+            errors.append("sequence does not finish with an end statement")
+
+        if errors:
+            raise SequenceError("Invalid HVI sequence {}: {}".format(self.name, "; ".join(errors)))
+        return self
+
+
+# ============================== Sequences of the four bench tests ==============================
+
+def _trigger_write_parameters(trigger, value):
+    return [("trigger", TriggerRef(trigger)),
+            ("sync_mode", hvi_const("SyncMode", "IMMEDIATE")),
+            ("value", hvi_const("TriggerValue", value))]
+
+
+def _trigger_write(sequence, engine, name, time, trigger, value):
+    sequence.add_instruction(engine, name, time, "trigger_write", _trigger_write_parameters(trigger, value))
+
+
+def _pulse_template(trigger, on_time, off_time):
+    # Every engine drives its front panel trigger ON and OFF again
+    template = EngineTemplate()
+    _output_trigger(template, trigger)
+    template.add_instruction("TriggerOn", on_time, "trigger_write", _trigger_write_parameters(trigger, "ON"))
+    template.add_instruction("TriggerOff", off_time, "trigger_write", _trigger_write_parameters(trigger, "OFF"))
+    return template
+
+
+def _output_trigger(engine_def, name, push_pull=True):
+    configuration = {"direction": hvi_const("Direction", "OUTPUT")}
+    if push_pull:
+        configuration["drive_mode"] = hvi_const("DriveMode", "PUSH_PULL")
+    configuration.update(polarity=hvi_const("TriggerPolarity", "ACTIVE_LOW"),
+                         delay=0,
+                         trigger_mode=hvi_const("TriggerMode", "LEVEL"),
+                         pulse_length=250)
+    return engine_def.add_trigger(name, "front_panel_1", **configuration)
+
+
+def build_helloworld_sequences(locations, sync_resources=True):
+    # One single-engine sequence per module: TriggerOn, TriggerOff, End. Pass sync_resources=False for instances that
+    # are loaded at the same time, so they do not all claim PXI_TRIGGER0/1
+    sequences = []
+    for location in locations:
+        sequence = HviSequence("KtHvi")
+        engine_def = sequence.add_engine("SdEngine1", location)
+        _output_trigger(engine_def, "SequenceTrigger", push_pull=False)
+
+        _trigger_write(sequence, "SdEngine1", "TriggerOn", 100, "SequenceTrigger", "ON")
+        _trigger_write(sequence, "SdEngine1", "TriggerOff", 1000, "SequenceTrigger", "OFF")
+        sequence.add_end("EndOfSequence", 10)
+
+        if sync_resources:
+            sequence.sync_resources = [hvi_const("TriggerResourceId", "PXI_TRIGGER0"), hvi_const("TriggerResourceId", "PXI_TRIGGER1")]
+        sequences.append(sequence)
+    return sequences
+
+
+def build_helloworldmimo_sequence(locations):
+    # All modules in one sequence, each engine pulsing its front panel trigger
+    sequence = HviSequence("KtHvi")
+    sequence.auto_detect_chassis = True
+
+    for index, location in enumerate(locations):
+        sequence.add_engine("SdEngine{}".format(index), location)
+    sequence.stamp(_pulse_template("SequenceTrigger", 10, 500))
+
+    sequence.add_end("EndOfSequence", 10)
+    sequence.sync_resources = [hvi_const("TriggerResourceId", "PXI_TRIGGER0"), hvi_const("TriggerResourceId", "PXI_TRIGGER1")]
+    return sequence
+
+
+def build_mimoresync_sequence(locations, master_index):
+    # The master engine waits for PXI2, all engines resynchronize in a junction, pulse their trigger and jump back
+    sequence = HviSequence("KtHvi")
+    sequence.auto_detect_chassis = True
+
+    for index, location in enumerate(locations):
+        sequence.add_engine("SdEngine{}".format(index), location)
+    master = sequence.engines[master_index]
+
+    # Add wait trigger just to be sure Pxi from the cards is not interfering Pxi2 triggering from a third card (the trigger the waitEvent is waiting for).
+    master.add_trigger("StartTrigger", "pxi_2",
+                       direction=hvi_const("Direction", "INPUT"),
+                       polarity=hvi_const("TriggerPolarity", "ACTIVE_LOW"))
+    master.add_event("StartEvent", "pxi_2")
+
+    sequence.add_wait_event(master.name, "wait external_trigger", 10, "StartEvent", hvi_const("EventDetectionMode", "ACTIVE"))
+    sequence.add_junction("GlobalJunction", 100)
+    sequence.stamp(_pulse_template("PulseOut", 10, 100))
+    sequence.add_jump("JumpStatement", 1000, START)
+    sequence.add_end("EndOfSequence", 10)
+
+    sequence.sync_resources = [hvi_const("TriggerResourceId", "PXI_TRIGGER5"), hvi_const("TriggerResourceId", "PXI_TRIGGER6"),
+                               hvi_const("TriggerResourceId", "PXI_TRIGGER7")]
+    return sequence
+
+
+def build_fastbranching_sequence(locations, master_index, nAWG=1, startDelay=0, nCycles=1, prescaler=0):
+    # The master engine waits for PXI2, then every engine queues the waveform selected by its WfNum register, triggers
+    # the AWG, and the master counts the received triggers in cycleCnt
+    sequence = HviSequence("KtHvi")
+    sequence.sync_resources = [hvi_const("TriggerResourceId", "PXI_TRIGGER0"), hvi_const("TriggerResourceId", "PXI_TRIGGER1"),
+                               hvi_const("TriggerResourceId", "PXI_TRIGGER7")]
+    sequence.non_hvi_core_clocks = [10e6]
+    sequence.auto_detect_chassis = len(locations) > 1
+
+    for index, location in enumerate(locations):
+        sequence.add_engine("SdEngine{}".format(index), location)
+    master = sequence.engines[master_index]
+
+    # cycleCnt counts the external trigger events on the master; WfNum selects the waveform to queue on each module
+    cycleCnt = master.add_register("cycleCnt")
+
+    master.add_event("extEvent", "pxi_2")
+    sequence.add_wait_event(master.name, "wait_external_trigger", 10, "extEvent", hvi_const("EventDetectionMode", "TRANSITION_TO_ACTIVE"))
+
+    # Add wait trigger just to be sure Pxi from the cards is not interfering Pxi2 triggering from a third card (the trigger the waitEvent is waiting for).
+    master.add_trigger("extTrigger", "pxi_2",
+                       direction=hvi_const("Direction", "INPUT"),
+                       polarity=hvi_const("TriggerPolarity", "ACTIVE_HIGH"))
+
+    sequence.add_junction("GlobalJunction", 10)
+
+    template = EngineTemplate()
+    wfNum = template.add_register("WfNum")
+    template.add_action("awg_start1", "awg1_start")
+    awg_trigger = template.add_action("awg_trigger1", "awg1_trigger")
+    template.add_instruction("awgQueueWaveform", 10, "queueWaveform",
+                             [("waveformNumber", wfNum),
+                              ("channel", nAWG),
+                              ("triggerMode", sd1_const("SD_TriggerModes", "SWHVITRIG")),
+                              ("startDelay", startDelay),
+                              ("cycles", nCycles),
+                              ("prescaler", prescaler)],
+                             scope="module")
+    template.add_instruction("AWG trigger", 2000, "action_execute", [("action", [awg_trigger])])
+    sequence.stamp(template)
+
+    sequence.add_instruction(master.name, "add", 10, "add",
+                             [("left_operand", 1), ("right_operand", cycleCnt), ("result_register", cycleCnt)])
+
+    sequence.add_jump("jumpStatement", 10000, START)
+    sequence.add_end("EndOfSequence", 100)
+    return sequence
@@ -0,0 +1,134 @@
+import sys
+sys.path.append('C:/Program Files (x86)/Keysight/SD1/Libraries/Python')
+import json
+import os
+import keysightSD1
+
+# On-disk cache of the chassis inventory used by create_module_inventory.
+#
+# Querying a slot means driver round trips (product name and serial number), so the results are kept in a JSON file
+# keyed by "chassis,slot"; a slot found empty is cached as well (product_name None). On a warm start the cache is
+# revalidated cheaply instead of re-querying every slot:
+#   1. one moduleCount() call for the whole system (a module added or removed changes the count), and
+#   2. one serial number probe per chassis, on the lowest cached occupied slot of that chassis.
+# A chassis that fails either check is re-queried slot by slot. Module swaps that keep the module count and leave the
+# probed slot untouched cannot be detected this way; pass refresh=True (test_bench.py --refresh-inventory) after
+# moving hardware around.
+
+CACHE_VERSION = 2
+DEFAULT_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "module_inventory_cache.json")
+
+
+def _slot_key(chassis, slot):
+    return "{},{}".format(chassis, slot)
+
+
+def query_slot(chassis, slot):
+    # Full (slow) query of one slot. Returns a cache record; its product_name is None if the slot is empty or could not
+    # be read
+
+    temp_mod = keysightSD1.SD_AOU() #Doesn't matter if it's dig or awg, it will be able to retrieve module name
+    try:
+        product_name = temp_mod.getProductNameBySlot(chassis, slot)
+        if not isinstance(product_name, str) or not product_name:
+            return {"chassis": chassis, "slot": slot, "product_name": None, "serial_number": None}
+        serial_number = temp_mod.getSerialNumberBySlot(chassis, slot)
+    finally:
+        temp_mod.close()
+
+    return {"chassis": chassis,
+            "slot": slot,
+            "product_name": product_name,
+            "serial_number": serial_number if isinstance(serial_number, str) else None}
+
+
+def load_inventory_cache(cache_file=DEFAULT_CACHE_FILE):
+    # Returns the cached inventory, or an empty one if the file is missing, unreadable, or from another cache version
+    try:
+        with open(cache_file, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {"version": CACHE_VERSION, "module_count": None, "slots": {}}
+    if cache.get("version") != CACHE_VERSION or not isinstance(cache.get("slots"), dict):
+        return {"version": CACHE_VERSION, "module_count": None, "slots": {}}
+    return cache
+
+
+def save_inventory_cache(cache, cache_file=DEFAULT_CACHE_FILE):
+    # Write to a temporary file first so an interrupted run never leaves a truncated cache behind
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, cache_file)
+
+
+def _module_count():
+    temp_mod = keysightSD1.SD_AOU()
+    try:
+        count = temp_mod.moduleCount()
+    finally:
+        temp_mod.close()
+    return count if isinstance(count, int) and count >= 0 else None
+
+
+def revalidate_inventory_cache(cache, chassis_list):
+    # Returns the set of chassis (out of chassis_list) whose cached slots can be trusted without re-querying them
+
+    module_count = _module_count()
+    if module_count is None or module_count != cache.get("module_count"):
+        return set()
+
+    valid_chassis = set()
+    temp_mod = keysightSD1.SD_AOU()
+    try:
+        for chassis in set(chassis_list):
+            cached_slots = sorted(record["slot"] for record in cache["slots"].values()
+                                  if record["chassis"] == chassis and record["product_name"] is not None)
+            if not cached_slots:
+                # Only empty slots cached: a module inserted into one of them changes the module count
+                if any(record["chassis"] == chassis for record in cache["slots"].values()):
+                    valid_chassis.add(chassis)
+                continue
+            record = cache["slots"][_slot_key(chassis, cached_slots[0])]
+            if record["serial_number"] is not None and temp_mod.getSerialNumberBySlot(chassis, cached_slots[0]) == record["serial_number"]:
+                valid_chassis.add(chassis)
+    finally:
+        temp_mod.close()
+    return valid_chassis
+
+
+def lookup_inventory(module_array, refresh=False, cache_file=DEFAULT_CACHE_FILE):
+    # Returns a cache record for every [chassis, slot] in module_array (None for empty slots), querying only the slots
+    # that are not covered by a valid cache entry. The cache file is rewritten whenever a slot had to be queried
+
+    cache = load_inventory_cache(cache_file)
+    if refresh:
+        cache["slots"] = {}
+        valid_chassis = set()
+    else:
+        requested_chassis = set(mod[0] for mod in module_array)
+        valid_chassis = revalidate_inventory_cache(cache, requested_chassis)
+        # Forget everything cached for a chassis that failed revalidation, not just the slots asked for this time
+        cache["slots"] = {key: record for key, record in cache["slots"].items()
+                          if record["chassis"] in valid_chassis or record["chassis"] not in requested_chassis}
+
+    records = []
+    queried = False
+    for mod in module_array:
+        key = _slot_key(mod[0], mod[1])
+        if mod[0] in valid_chassis and key in cache["slots"]:
+            record = cache["slots"][key]
+        else:
+            record = query_slot(mod[0], mod[1])
+            queried = True
+            cache["slots"][key] = record
+        records.append(record if record["product_name"] is not None else None)
+
+    if queried:
+        cache["module_count"] = _module_count()
+        try:
+            save_inventory_cache(cache, cache_file)
+        except OSError as ex:
+            print("[ERROR] inventory_cache.lookup_inventory: Could not write {}: {}".format(cache_file, ex))
+
+    return records
@@ -0,0 +1,128 @@
+import sys
+sys.path.append('C:/Program Files (x86)/Keysight/SD1/Libraries/Python')
+import threading
+import keysightSD1
+from test_initialization import open_modules
+
+# Session-scoped pool of open SD1 modules.
+#
+# Opening a module is one of the slowest steps of a bench run, and every Test object used to open all of its modules in
+# __init__ and close them again in close_modules(). A ModulePool opens each module once for the whole session and lends
+# the handles to the Test objects (pass pool=... to the test constructor). When a test is done, close_modules() hands
+# the modules back and the pool resets them to a known state instead of closing them: AWGs/DAQs stopped and their queues
+# flushed, AWG channels switched off (wave shape AOU_OFF, amplitude and offset 0) and the trigger IO set as input.
+# Waveform memory is left alone; the fast branching hardware configurator manages it itself.
+#
+# lend() and give_back() may be called from different threads (bench_pipeline.py builds the next test on a worker
+# thread while the current one is handed back), so they are serialized by a lock. A module is lent to at most
+# max_holders tests at a time (the test on hardware and the one being built); lending it once more, or handing back a
+# module that is not lent, is reported as an error.
+#
+#   pool = ModulePool(module_dict)
+#   hello_world_test = test_helloworld(module_dict, pool=pool)
+#   ...
+#   hello_world_test.close_modules()   # back to the pool
+#   pool.close()                        # end of session
+
+
+class ModulePool:
+
+    max_holders = 2
+
+    # Reset values of the AWG channel settings (see reset_module)
+    reset_waveshape = keysightSD1.SD_Waveshapes.AOU_OFF
+    reset_amplitude = 0.0
+    reset_offset = 0.0
+    reset_trigger_direction = keysightSD1.SD_TriggerDirections.AOU_TRG_IN
+
+    def __init__(self, module_dict, concurrent=True, max_workers=8):
+        self.module_dict = dict(module_dict)
+        self.modules = {} # FORMAT: {MODULE NAME: [INSTANCE, MODULE NAME, [CHASSIS SLOT]]}
+        self.open_errors = {} # FORMAT: {MODULE NAME: ERROR CODE}
+        self.reset_errors = {} # FORMAT: {MODULE NAME: [(CALL, ERROR CODE), ...]} from the most recent reset of each module
+        self.lent = {} # FORMAT: {MODULE NAME: NUMBER OF TESTS CURRENTLY HOLDING IT}
+        self.open_time = 0.0
+        self._lock = threading.RLock()
+        self._open(self.module_dict, concurrent, max_workers)
+
+    def _open(self, module_dict, concurrent=True, max_workers=8):
+        module_instances, open_errors, elapsed = open_modules(module_dict, concurrent, max_workers)
+        for module_inst in module_instances:
+            self.modules[module_inst[1]] = module_inst
+        self.open_errors.update(open_errors)
+        self.open_time += elapsed
+
+    def lend(self, module_dict):
+        # Returns (module_instances, open_errors) for the modules in module_dict, in module_dict order. Modules that are
+        # not in the pool yet are opened and added to it
+        with self._lock:
+            missing = {key: value for key, value in module_dict.items() if key not in self.modules and key not in self.open_errors}
+            if missing:
+                self.module_dict.update(missing)
+                self._open(missing)
+
+            module_instances = []
+            open_errors = {}
+            for key in module_dict:
+                if key in self.open_errors:
+                    open_errors[key] = self.open_errors[key]
+                if key not in self.modules:
+                    continue
+                # A module may be lent to more than one test at a time, e.g. while bench_pipeline.py builds the next test's
+                # HVI during the current test. Only one of them may be on hardware at a time
+                if self.lent.get(key, 0) >= self.max_holders:
+                    print("[ERROR] module_pool.ModulePool.lend: {} is already lent to {} tests".format(key, self.lent[key]))
+                self.lent[key] = self.lent.get(key, 0) + 1
+                module_instances.append(self.modules[key])
+
+            return module_instances, open_errors
+
+    def give_back(self, module_instances):
+        # Resets the modules and marks them as available again. They stay open
+        with self._lock:
+            for module_inst in module_instances:
+                if self.lent.get(module_inst[1], 0) < 1:
+                    print("[ERROR] module_pool.ModulePool.give_back: {} is not lent".format(module_inst[1]))
+                    continue
+                self.reset_module(module_inst)
+                if self.lent[module_inst[1]] > 1:
+                    self.lent[module_inst[1]] -= 1
+                else:
+                    del self.lent[module_inst[1]]
+
+    def reset_module(self, module_inst):
+        # Puts a module back into a known state: every AWG (or DAQ) channel stopped and its queue flushed; on AWGs the
+        # channel output settings and the trigger IO direction are also set back to the reset values above
+        module = module_inst[0]
+        errors = []
+
+        def check(name, error):
+            if isinstance(error, int) and error < 0:
+                errors.append((name, error))
+
+        hwVer = module.getHardwareVersion()
+        first_channel = 0 if hwVer < 4 else 1
+        for channel in range(first_channel, first_channel + 4):
+            if isinstance(module, keysightSD1.SD_AIN):
+                check("DAQstop({})".format(channel), module.DAQstop(channel))
+                check("DAQflush({})".format(channel), module.DAQflush(channel))
+            else:
+                check("AWGstop({})".format(channel), module.AWGstop(channel))
+                check("AWGflush({})".format(channel), module.AWGflush(channel))
+                check("channelWaveShape({})".format(channel), module.channelWaveShape(channel, self.reset_waveshape))
+                check("channelAmplitude({})".format(channel), module.channelAmplitude(channel, self.reset_amplitude))
+                check("channelOffset({})".format(channel), module.channelOffset(channel, self.reset_offset))
+        if not isinstance(module, keysightSD1.SD_AIN):
+            check("triggerIOconfig", module.triggerIOconfig(self.reset_trigger_direction))
+
+        self.reset_errors[module_inst[1]] = errors
+        for call, error in errors:
+            print("[ERROR] module_pool.ModulePool.reset_module: {} on {} returned {}".format(call, module_inst[1], error))
+
+    def close(self):
+        # End of session: close every module in the pool
+        with self._lock:
+            for module_inst in self.modules.values():
+                module_inst[0].close()
+            self.modules = {}
+            self.lent = {}
@@ -0,0 +1,69 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Cached HVI register handles and broadcast writes.
+#
+# Writing a register on every engine as hvi.engines[index].main_sequence.registers[name].write(value) walks the
+# engine collection, the sequence and the register collection through pyhvi on every update. RegisterBank resolves
+# the handles once, after the HVI instance is compiled, and broadcast() then only calls write() on each handle:
+#
+#   bank = RegisterBank(hvi, ["WfNum"])
+#   bank.broadcast("WfNum", 2)     # returns the seconds the full update took
+#   print(bank.report())
+#
+# With concurrent=True the writes of one broadcast are issued in parallel on a thread pool, which pays off when each
+# write is a slow driver round trip and there are many engines. The handles belong to the HVI instance they were
+# resolved from: build a new bank when the instance changes.
+
+DEFAULT_MAX_WORKERS = 8
+
+
+class RegisterBank:
+
+    def __init__(self, hvi, names, concurrent=False, max_workers=DEFAULT_MAX_WORKERS):
+        self.handles = {} # FORMAT: {REGISTER NAME: [REGISTER HANDLE PER ENGINE]}
+        for name in names:
+            self.handles[name] = []
+        for index in range(0, hvi.engines.count):
+            registers = hvi.engines[index].main_sequence.registers
+            for name in names:
+                try:
+                    self.handles[name].append(registers[name])
+                except Exception as ex:
+                    print("[ERROR] register_bank.RegisterBank: engine {} has no register {}: {}".format(index, name, ex))
+
+        self.updates = 0
+        self.update_time = 0.0
+        self.max_update_time = 0.0
+        self._pool = None
+        if concurrent:
+            self._pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, hvi.engines.count)))
+
+    def broadcast(self, name, value):
+        # Writes value to register name on every engine. Returns the wall-clock seconds of the full update
+        handles = self.handles[name]
+        start = time.perf_counter()
+        if self._pool is not None and len(handles) > 1:
+            list(self._pool.map(lambda handle: handle.write(value), handles))
+        else:
+            for handle in handles:
+                handle.write(value)
+        elapsed = time.perf_counter() - start
+
+        self.updates += 1
+        self.update_time += elapsed
+        if elapsed > self.max_update_time:
+            self.max_update_time = elapsed
+        return elapsed
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def report(self):
+        if self.updates == 0:
+            return "Register broadcasts: none"
+        engines = max(len(handles) for handles in self.handles.values()) if self.handles else 0
+        return "Register broadcasts: {} updates on {} engines, mean {:.1f} us, max {:.1f} us per full update".format(
+            self.updates, engines, 1e6 * self.update_time / self.updates, 1e6 * self.max_update_time)
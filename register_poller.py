@@ -0,0 +1,196 @@
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+
+# Background sampling of HVI registers.
+#
+# Reading seq_master.registers["cycleCnt"] on the thread that fires the triggers puts a driver round trip on the
+# trigger path. RegisterPoller instead samples a set of registers at a fixed rate on an asyncio event loop that runs in
+# its own thread, and keeps the samples in a bounded ring buffer (the oldest are dropped once it is full).
+#
+#   poller = RegisterPoller(test.seq_master.registers, ["cycleCnt", "WfNum"], rate=2000)
+#   poller.start()
+#   ...                      # trigger path: poller.mark_trigger(issued) once each trigger call returned, nothing else
+#   poller.stop()
+#   print(poller.report())
+#
+# One register is the event counter (count_register, cycleCnt by default). A trigger is marked once its trigger call
+# has returned, so every sample whose read starts after the mark (plus settle_time) must already include its count: the
+# HVI counts a trigger in nanoseconds. Increments are paired with those marks in trigger order, oldest first, which
+# gives the trigger-to-count latency (from the issue time, resolution: one poll period); a mark that is left without an
+# increment is a missed event, and an increment no mark accounts for is an unexpected count. Timestamps are
+# time.perf_counter() seconds.
+
+DEFAULT_RATE = 1000 # samples/s
+DEFAULT_CAPACITY = 100000 # samples kept in the ring buffer
+
+
+class RegisterPoller:
+
+    def __init__(self, registers, names, rate=DEFAULT_RATE, capacity=DEFAULT_CAPACITY, count_register="cycleCnt",
+                 settle_time=0.0):
+        # registers:   mapping name -> register with read(), e.g. seq_master.registers
+        # names:       registers to sample; count_register is added if missing (None for no event counting)
+        # settle_time: extra seconds a marked trigger gets to show up in the counter before it can be judged missed
+        self.names = list(names)
+        if count_register is not None and count_register not in self.names:
+            self.names.append(count_register)
+        self.registers = [registers[name] for name in self.names]
+        self.count_index = self.names.index(count_register) if count_register is not None else None
+        self.period = 1.0 / rate
+        self.settle_time = settle_time
+
+        self.samples = deque(maxlen=capacity) # FORMAT: (TIMESTAMP, (VALUE PER NAME, ...))
+        self.latencies = deque(maxlen=capacity) # trigger-to-count latency of every counted trigger, seconds
+        self.sample_count = 0 # all samples taken, including those dropped from the ring buffer
+        self.overruns = 0 # polls that started a full period or more late
+        self.read_errors = 0
+        self.counted = 0 # triggers matched by a counter increment
+        self.missed = 0 # triggers the counter did not count
+        self.unexpected = 0 # counter increments without a trigger
+        self._marks = queue.SimpleQueue() # FORMAT: (ISSUE TIME, MARK TIME), handed over by the trigger thread
+        self._pending = deque() # FORMAT: (ISSUE TIME, MARK TIME) of the triggers not judged yet, poll thread only
+        self._credits = 0 # increments seen but not paired yet (their trigger may not be marked yet)
+        self._last_count = None
+
+        self._loop = None
+        self._thread = None
+        self._task = None
+
+    def mark_trigger(self, issued=None):
+        # Called from the trigger path once a trigger call has returned; issued is when the call started (default: now).
+        # Only puts the mark on a queue; the poll thread moves it to its own pending list
+        now = time.perf_counter()
+        self._marks.put((now if issued is None else issued, now))
+
+    def _sample(self):
+        read_start = time.perf_counter()
+        try:
+            values = tuple(register.read() for register in self.registers)
+        except Exception as ex:
+            self.read_errors += 1
+            if self.read_errors == 1:
+                print("[ERROR] register_poller.RegisterPoller: register read failed: {}".format(ex))
+            return
+        now = time.perf_counter()
+        self.samples.append((now, values))
+        self.sample_count += 1
+        if self.count_index is not None:
+            self._match_triggers(read_start, now, values[self.count_index])
+
+    def _match_triggers(self, read_start, now, count):
+        # Pairs the increments seen up to this sample with the triggers marked before the read started
+        while True:
+            try:
+                self._pending.append(self._marks.get_nowait())
+            except queue.Empty:
+                break
+        if self._last_count is not None and count > self._last_count:
+            self._credits += count - self._last_count
+        self._last_count = count
+
+        judged = 0
+        for issued, marked in self._pending:
+            if marked > read_start - self.settle_time:
+                break
+            judged += 1
+        if judged:
+            triggers = [self._pending.popleft() for _ in range(0, judged)]
+            counted = min(self._credits, judged)
+            for issued, marked in triggers[:counted]:
+                self.latencies.append(now - issued)
+            self.counted += counted
+            self.missed += judged - counted
+            self._credits -= counted
+        if self._credits and not self._pending:
+            self.unexpected += self._credits
+            self._credits = 0
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        next_time = loop.time()
+        while True:
+            self._sample()
+            next_time += self.period
+            delay = next_time - loop.time()
+            if delay <= -self.period:
+                self.overruns += 1
+                next_time = loop.time() # don't try to catch up with a burst of samples
+                delay = 0
+            await asyncio.sleep(max(0, delay))
+
+    async def _cancel(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def start(self):
+        # The counter baseline is read here, so triggers marked before the poll thread takes its first sample still
+        # pair with the right increments
+        if self.count_index is not None:
+            self._last_count = self.registers[self.count_index].read()
+        self._loop = asyncio.new_event_loop()
+        self._task = self._loop.create_task(self._poll())
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self, drain=True):
+        # Stops sampling. With drain, first keeps polling until the pending triggers are judged
+        if self._thread is None:
+            return
+        if drain:
+            deadline = time.perf_counter() + self.settle_time + 3 * self.period
+            while (self._pending or not self._marks.empty()) and time.perf_counter() < deadline:
+                time.sleep(self.period)
+        asyncio.run_coroutine_threadsafe(self._cancel(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def counts_per_second(self):
+        # Counter increments per second over the samples in the ring buffer
+        if self.count_index is None or len(self.samples) < 2:
+            return 0.0
+        (first_time, first_values), (last_time, last_values) = self.samples[0], self.samples[-1]
+        if last_time <= first_time:
+            return 0.0
+        return (last_values[self.count_index] - first_values[self.count_index]) / (last_time - first_time)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {"samples": self.sample_count,
+                "dropped_samples": self.sample_count - len(self.samples),
+                "overruns": self.overruns,
+                "read_errors": self.read_errors,
+                "counted": self.counted,
+                "missed": self.missed,
+                "pending": len(self._pending) + self._marks.qsize(),
+                "unexpected": self.unexpected,
+                "counts_per_second": self.counts_per_second(),
+                "latency_median": latencies[len(latencies) // 2] if latencies else None,
+                "latency_max": latencies[-1] if latencies else None}
+
+    def report(self):
+        stats = self.stats()
+        lines = ["Register poller: {} samples ({} dropped from the buffer), {} overruns, {} read errors".format(
+            stats["samples"], stats["dropped_samples"], stats["overruns"], stats["read_errors"])]
+        if self.count_index is not None:
+            lines.append("{}: {:.1f} counts/s, {} triggers counted, {} missed, {} still pending, {} unexpected counts".format(
+                self.names[self.count_index], stats["counts_per_second"], stats["counted"], stats["missed"],
+                stats["pending"], stats["unexpected"]))
+            if stats["latency_median"] is not None:
+                lines.append("Trigger-to-count latency: median {:.1f} us, max {:.1f} us (poll period {:.1f} us)".format(
+                    1e6 * stats["latency_median"], 1e6 * stats["latency_max"], 1e6 * self.period))
+        return "\n".join(lines)
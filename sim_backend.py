@@ -0,0 +1,142 @@
+import sys
+import threading
+import time
+from trigger_scheduler import wait_until
+
+# Simulated keysightSD1/pyhvi backend.
+#
+# The bench imports keysightSD1 and pyhvi directly. install() puts the simulated drivers (sim_keysightSD1.py and
+# sim_pyhvi.py) in sys.modules under those names, so every later "import keysightSD1" / "import pyhvi" gets the
+# simulation. It must run before anything imports the real drivers:
+#
+#   import sim_backend
+#   sim_backend.install(sim_backend.LatencyModel(scale=0.1))
+#   from test_initialization import *     # now runs on the simulation
+#
+# or, for the test bench, "python test_bench.py --simulate".
+#
+# The simulation keeps the platform state in one SimPlatform: the modules installed in each chassis slot, the PXI
+# trigger lines of each chassis and the HVI instances that are running. A running HVI executes its sequence when the
+# PXI line its wait event listens to goes through a LOW -> HIGH transition (e.g. test_fastbranching.triggerPXI2), so
+# registers such as cycleCnt count triggers like on hardware.
+#
+# Every driver call waits for the time given by the LatencyModel, which also counts the calls and the simulated time
+# spent per latency kind.
+
+# Default latencies, seconds. Rough figures for a PXIe chassis with M320x/M310x modules
+DEFAULT_LATENCIES = {
+    "open": 0.25, # openWithSlot/openWithOptions/openWithSerialNumber
+    "close": 0.02,
+    "slot_query": 0.005, # moduleCount, get*BySlot, get*ByIndex
+    "call": 20e-6, # any other SD1 call (channel/AWG/trigger settings, getters)
+    "queue_waveform": 30e-6, # AWGqueueWaveform
+    "waveform_load": 200e-6, # waveformLoad/waveformReLoad, per call
+    "waveform_load_per_byte": 5e-9, # waveformLoad/waveformReLoad, per byte of waveform data (~200 MB/s)
+    "waveform_flush": 0.01,
+    "define": 10e-6, # each pyhvi definition call (engines/registers/triggers/instructions add, set_parameter, ...)
+    "compile": 0.2, # KtHvi.compile, per call
+    "compile_per_instruction": 0.005, # KtHvi.compile, per sequence statement
+    "load_to_hw": 0.05, # KtHvi.load_to_hw, per call
+    "load_to_hw_per_engine": 0.01,
+    "run": 1e-3,
+    "release_hw": 5e-3,
+    "register_read": 30e-6,
+    "register_write": 30e-6,
+}
+
+# Modules installed in the simulated chassis: {(CHASSIS, SLOT): PRODUCT NAME}. Matches the locations in test_bench.py
+DEFAULT_MODULES = {(1, 7): "M3202A", (1, 8): "M3202A", (1, 10): "M3202A"}
+
+
+class LatencyModel:
+
+    def __init__(self, scale=1.0, **latencies):
+        # scale multiplies every latency (0 for an instantaneous simulation); keyword arguments override single
+        # entries of DEFAULT_LATENCIES, in seconds
+        unknown = set(latencies) - set(DEFAULT_LATENCIES)
+        if unknown:
+            raise ValueError("Unknown latency kinds: {}".format(", ".join(sorted(unknown))))
+        self.scale = scale
+        self.latencies = dict(DEFAULT_LATENCIES)
+        self.latencies.update(latencies)
+        self.calls = {} # FORMAT: {LATENCY KIND: NUMBER OF DELAYS}
+        self.simulated_time = {} # FORMAT: {LATENCY KIND: SECONDS}
+        self._lock = threading.Lock()
+
+    def seconds(self, kind, units=1):
+        return self.latencies[kind] * units * self.scale
+
+    def delay(self, kind, units=1):
+        # Waits for units times the latency of kind
+        seconds = self.seconds(kind, units)
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            self.simulated_time[kind] = self.simulated_time.get(kind, 0.0) + seconds
+        if seconds > 0:
+            wait_until(time.perf_counter() + seconds)
+
+    def report(self):
+        lines = ["Simulated driver time (latency scale {:g}):".format(self.scale)]
+        for kind in sorted(self.simulated_time, key=self.simulated_time.get, reverse=True):
+            lines.append("  {:<24} {:>8} calls {:>10.3f} s".format(kind, self.calls[kind], self.simulated_time[kind]))
+        return "\n".join(lines)
+
+
+class SimPlatform:
+
+    def __init__(self, modules=None):
+        self.lock = threading.RLock() # guards the trigger lines, running HVIs and register values
+        self.configure(modules)
+
+    def configure(self, modules=None):
+        self.modules = dict(DEFAULT_MODULES if modules is None else modules)
+        self.pxi_lines = {} # FORMAT: {(CHASSIS, LINE): VALUE}; lines idle HIGH
+        self.running = [] # running sim_pyhvi.KtHvi instances
+        self.claimed_resources = {} # FORMAT: {SYNC RESOURCE: KtHvi that loaded it last}; conflicts only while it runs
+
+    def locations(self):
+        return sorted(self.modules)
+
+    def product_name(self, chassis, slot):
+        return self.modules.get((chassis, slot))
+
+    def serial_number(self, chassis, slot):
+        return "SIM{:02d}{:02d}".format(chassis, slot) if (chassis, slot) in self.modules else None
+
+    def pxi_write(self, chassis, line, value):
+        # Drives PXI trigger line of a chassis; a LOW -> HIGH transition is an event for the HVIs waiting on it
+        with self.lock:
+            previous = self.pxi_lines.get((chassis, line), 1)
+            self.pxi_lines[(chassis, line)] = value
+            if previous == 0 and value != 0:
+                for hvi in list(self.running):
+                    hvi._sim_event(chassis, "pxi_{}".format(line))
+
+    def pxi_read(self, chassis, line):
+        with self.lock:
+            return self.pxi_lines.get((chassis, line), 1)
+
+
+latency = LatencyModel()
+platform = SimPlatform()
+
+
+def install(latency_model=None, modules=None):
+    # Selects the simulation for every later import of keysightSD1 and pyhvi. latency_model: LatencyModel to use,
+    # modules: {(CHASSIS, SLOT): PRODUCT NAME} to install instead of DEFAULT_MODULES
+    global latency
+    for name in ("keysightSD1", "pyhvi"):
+        if name in sys.modules and not getattr(sys.modules[name], "SIMULATED", False):
+            print("[ERROR] sim_backend.install: {} was already imported; install() must run before the bench modules are imported".format(name))
+    if latency_model is not None:
+        latency = latency_model
+    platform.configure(modules)
+
+    import sim_keysightSD1
+    import sim_pyhvi
+    sys.modules["keysightSD1"] = sim_keysightSD1
+    sys.modules["pyhvi"] = sim_pyhvi
+
+
+def is_installed():
+    return getattr(sys.modules.get("keysightSD1"), "SIMULATED", False)
@@ -0,0 +1,500 @@
+import threading
+import numpy
+import sim_backend
+
+# Simulated keysightSD1 (see sim_backend.py). Only the part of the API the bench and the example scripts use is
+# implemented; the enum values follow the real driver.
+
+SIMULATED = True
+
+
+class SD_Error:
+    STATUS_DEMO = 1
+    OPENING_MODULE = -8000
+    CLOSING_MODULE = -8001
+    OPENING_HVI = -8002
+    MODULE_NOT_OPENED = -8003
+    INVALID_PARAMETERS = -8010
+    INVALID_WAVE = -8013
+    MODULE_NOT_FOUND = -8021
+    INVALID_OBJECTID = -8025
+
+
+class SD_Waveshapes:
+    AOU_HIZ = -1
+    AOU_OFF = 0
+    AOU_SINUSOIDAL = 1
+    AOU_TRIANGULAR = 2
+    AOU_SQUARE = 4
+    AOU_DC = 5
+    AOU_AWG = 6
+    AOU_PARTNER = 8
+
+
+class SD_TriggerModes:
+    AUTOTRIG = 0
+    VIHVITRIG = 1
+    SWHVITRIG = 1
+    EXTTRIG = 2
+    SWHVITRIG_CYCLE = 5
+    EXTTRIG_CYCLE = 6
+    ANALOGAUTOTRIG = 11
+
+
+class SD_SyncModes:
+    SYNC_NONE = 0
+    SYNC_CLK10 = 1
+
+
+class SD_QueueMode:
+    ONE_SHOT = 0
+    CYCLIC = 1
+
+
+class SD_WaveformTypes:
+    WAVE_ANALOG = 0
+    WAVE_IQ = 2
+    WAVE_IQPOLAR = 3
+    WAVE_DIGITAL = 5
+    WAVE_ANALOG_DUAL = 7
+
+
+class SD_TriggerExternalSources:
+    TRIGGER_EXTERN = 0
+    TRIGGER_PXI = 4000
+    TRIGGER_PXI0 = 4000
+    TRIGGER_PXI1 = 4001
+    TRIGGER_PXI2 = 4002
+    TRIGGER_PXI3 = 4003
+    TRIGGER_PXI4 = 4004
+    TRIGGER_PXI5 = 4005
+    TRIGGER_PXI6 = 4006
+    TRIGGER_PXI7 = 4007
+
+
+class SD_TriggerValue:
+    LOW = 0
+    HIGH = 1
+
+
+class SD_TriggerDirections:
+    AOU_TRG_OUT = 0
+    AOU_TRG_IN = 1
+
+
+_wave_ids = iter(range(1, 1 << 31))
+_wave_ids_lock = threading.Lock()
+
+
+class SD_Wave:
+
+    def __init__(self):
+        self.waveform_type = None
+        self.data = None # numpy array with shape (channels, samples)
+        self.nbytes = 0
+        self.id = None
+
+    def newFromArrayDouble(self, waveformType, waveformDataA, waveformDataB=None):
+        sim_backend.latency.delay("call")
+        channels = [waveformDataA] if waveformDataB is None else [waveformDataA, waveformDataB]
+        try:
+            self.data = numpy.array(channels, dtype=numpy.float64)
+        except (TypeError, ValueError):
+            return SD_Error.INVALID_WAVE
+        if self.data.ndim != 2 or self.data.shape[1] == 0:
+            return SD_Error.INVALID_WAVE
+        self.waveform_type = waveformType
+        self.nbytes = self.data.nbytes
+        with _wave_ids_lock:
+            self.id = next(_wave_ids)
+        return self.id
+
+    def newFromFile(self, waveformFile):
+        from waveform_file import read_csv_waveform
+        try:
+            data, header = read_csv_waveform(waveformFile)
+        except (OSError, ValueError):
+            return SD_Error.INVALID_WAVE
+        waveform_type = SD_WaveformTypes.WAVE_ANALOG_DUAL if data.shape[0] == 2 else SD_WaveformTypes.WAVE_ANALOG
+        return self.newFromArrayDouble(waveform_type, *data)
+
+    def getType(self):
+        return self.waveform_type if self.data is not None else SD_Error.INVALID_OBJECTID
+
+    def getPoints(self):
+        return self.data.shape[1] if self.data is not None else SD_Error.INVALID_OBJECTID
+
+
+_module_ids = iter(range(1, 1 << 31))
+_module_ids_lock = threading.Lock()
+
+
+class SD_Module:
+
+    def __init__(self):
+        self.id = None
+        self.chassis = None
+        self.slot = None
+        self.product_name = None
+        self._hvi = None
+        self.pxi_writes = 0
+
+    # ---------- Module enumeration ----------
+
+    def moduleCount(self):
+        sim_backend.latency.delay("slot_query")
+        return len(sim_backend.platform.modules)
+
+    def _by_index(self, index):
+        locations = sim_backend.platform.locations()
+        if not 0 <= index < len(locations):
+            return None
+        return locations[index]
+
+    def getChassisByIndex(self, index):
+        sim_backend.latency.delay("slot_query")
+        location = self._by_index(index)
+        return location[0] if location is not None else SD_Error.INVALID_PARAMETERS
+
+    def getSlotByIndex(self, index):
+        sim_backend.latency.delay("slot_query")
+        location = self._by_index(index)
+        return location[1] if location is not None else SD_Error.INVALID_PARAMETERS
+
+    def getProductNameByIndex(self, index):
+        sim_backend.latency.delay("slot_query")
+        location = self._by_index(index)
+        return sim_backend.platform.product_name(*location) if location is not None else SD_Error.INVALID_PARAMETERS
+
+    def getSerialNumberByIndex(self, index):
+        sim_backend.latency.delay("slot_query")
+        location = self._by_index(index)
+        return sim_backend.platform.serial_number(*location) if location is not None else SD_Error.INVALID_PARAMETERS
+
+    def getProductNameBySlot(self, chassis, slot):
+        sim_backend.latency.delay("slot_query")
+        name = sim_backend.platform.product_name(chassis, slot)
+        return name if name is not None else SD_Error.MODULE_NOT_FOUND
+
+    def getSerialNumberBySlot(self, chassis, slot):
+        sim_backend.latency.delay("slot_query")
+        serial = sim_backend.platform.serial_number(chassis, slot)
+        return serial if serial is not None else SD_Error.MODULE_NOT_FOUND
+
+    # ---------- Open / close ----------
+
+    def _accepts(self, product_name):
+        return True
+
+    def openWithSlot(self, partNumber, nChassis, nSlot):
+        sim_backend.latency.delay("open")
+        product_name = sim_backend.platform.product_name(nChassis, nSlot)
+        if product_name is None or not self._accepts(product_name) or (partNumber and partNumber != product_name):
+            return SD_Error.OPENING_MODULE
+        with _module_ids_lock:
+            self.id = next(_module_ids)
+        self.chassis = nChassis
+        self.slot = nSlot
+        self.product_name = product_name
+        self._hvi = None
+        self._open_state()
+        return self.id
+
+    def openWithOptions(self, partNumber, nChassis, nSlot, options=""):
+        return self.openWithSlot(partNumber, nChassis, nSlot)
+
+    def openWithSerialNumber(self, partNumber, serialNumber):
+        for chassis, slot in sim_backend.platform.locations():
+            if sim_backend.platform.serial_number(chassis, slot) == serialNumber:
+                return self.openWithSlot(partNumber, chassis, slot)
+        sim_backend.latency.delay("open")
+        return SD_Error.OPENING_MODULE
+
+    def _open_state(self):
+        pass
+
+    def close(self):
+        if self.id is None:
+            return SD_Error.MODULE_NOT_OPENED
+        sim_backend.latency.delay("close")
+        self.id = None
+        self._hvi = None
+        return 0
+
+    def isOpen(self):
+        return self.id is not None
+
+    def _call(self):
+        # Latency of an ordinary call; returns an error code if the module is not open, else None
+        sim_backend.latency.delay("call")
+        if self.id is None:
+            return SD_Error.MODULE_NOT_OPENED
+        return None
+
+    # ---------- Module information ----------
+
+    def getProductName(self):
+        return self._call() or self.product_name
+
+    def getSerialNumber(self):
+        return self._call() or sim_backend.platform.serial_number(self.chassis, self.slot)
+
+    def getChassis(self):
+        return self._call() or self.chassis
+
+    def getSlot(self):
+        return self._call() or self.slot
+
+    def getHardwareVersion(self):
+        return self._call() or 4
+
+    def getFirmwareVersion(self):
+        return self._call() or 4.0
+
+    @property
+    def hvi(self):
+        # HVI interface of the open module (sim_pyhvi.ModuleHvi), None while the module is closed
+        if self.id is None:
+            return None
+        if self._hvi is None:
+            import sim_pyhvi
+            self._hvi = sim_pyhvi.ModuleHvi(self)
+        return self._hvi
+
+    # ---------- PXI triggers ----------
+
+    def PXItriggerWrite(self, nPXItrigger, value):
+        error = self._call()
+        if error:
+            return error
+        line = nPXItrigger - SD_TriggerExternalSources.TRIGGER_PXI
+        if not 0 <= line <= 7:
+            return SD_Error.INVALID_PARAMETERS
+        self.pxi_writes += 1
+        sim_backend.platform.pxi_write(self.chassis, line, value)
+        return 0
+
+    def PXItriggerRead(self, nPXItrigger):
+        error = self._call()
+        if error:
+            return error
+        line = nPXItrigger - SD_TriggerExternalSources.TRIGGER_PXI
+        if not 0 <= line <= 7:
+            return SD_Error.INVALID_PARAMETERS
+        return sim_backend.platform.pxi_read(self.chassis, line)
+
+
+class _AwgState:
+
+    def __init__(self):
+        self.queue = [] # FORMAT: [(WAVEFORM NUMBER, TRIGGER MODE, START DELAY, CYCLES, PRESCALER)]
+        self.queue_mode = SD_QueueMode.ONE_SHOT
+        self.sync_mode = SD_SyncModes.SYNC_NONE
+        self.running = False
+        self.triggers = 0 # AWGtrigger calls and HVI AWG trigger actions while running
+        self.played = [] # waveform numbers played, in order (bounded)
+
+
+class SD_AOU(SD_Module):
+
+    MAX_PLAYED = 100000
+
+    def _accepts(self, product_name):
+        return len(product_name) > 2 and product_name[2] == "2"
+
+    def _open_state(self):
+        self.waveforms = {} # FORMAT: {WAVEFORM NUMBER: SD_Wave}
+        self.awgs = {} # FORMAT: {CHANNEL: _AwgState}
+        self.channels = {} # FORMAT: {CHANNEL: {SETTING: VALUE}}
+        self.trigger_io = {"direction": None, "value": 0}
+        self._lock = threading.Lock()
+
+    def _awg(self, nAWG):
+        # Channels 0-3 (hardware version < 4) or 1-4 are accepted alike
+        if not 0 <= nAWG <= 4:
+            return None
+        return self.awgs.setdefault(nAWG, _AwgState())
+
+    def _channel_setting(self, nChannel, setting, value):
+        error = self._call()
+        if error:
+            return error
+        self.channels.setdefault(nChannel, {})[setting] = value
+        return 0
+
+    def channelWaveShape(self, nChannel, waveShape):
+        return self._channel_setting(nChannel, "waveshape", waveShape)
+
+    def channelAmplitude(self, nChannel, amplitude):
+        return self._channel_setting(nChannel, "amplitude", amplitude)
+
+    def channelOffset(self, nChannel, offset):
+        return self._channel_setting(nChannel, "offset", offset)
+
+    def channelFrequency(self, nChannel, frequency):
+        return self._channel_setting(nChannel, "frequency", frequency)
+
+    def AWGfreezeOnStopEnable(self, nAWG, enable):
+        return self._channel_setting(nAWG, "freeze_on_stop", enable)
+
+    def _awg_call(self, nAWG):
+        # Returns (_AwgState, None) or (None, error code)
+        error = self._call()
+        if error:
+            return None, error
+        awg = self._awg(nAWG)
+        if awg is None:
+            return None, SD_Error.INVALID_PARAMETERS
+        return awg, None
+
+    def AWGqueueConfig(self, nAWG, mode):
+        awg, error = self._awg_call(nAWG)
+        if error:
+            return error
+        awg.queue_mode = mode
+        return 0
+
+    def AWGqueueSyncMode(self, nAWG, syncMode):
+        awg, error = self._awg_call(nAWG)
+        if error:
+            return error
+        awg.sync_mode = syncMode
+        return 0
+
+    def AWGqueueWaveform(self, nAWG, waveformNumber, triggerMode, startDelay, cycles, prescaler):
+        sim_backend.latency.delay("queue_waveform")
+        return self._queue_waveform(nAWG, waveformNumber, triggerMode, startDelay, cycles, prescaler)
+
+    def _queue_waveform(self, nAWG, waveformNumber, triggerMode, startDelay, cycles, prescaler):
+        # Also used by the HVI queueWaveform instruction, which has no host latency
+        if self.id is None:
+            return SD_Error.MODULE_NOT_OPENED
+        awg = self._awg(nAWG)
+        if awg is None or cycles < 0 or prescaler < 0:
+            return SD_Error.INVALID_PARAMETERS
+        with self._lock:
+            if waveformNumber not in self.waveforms:
+                return SD_Error.INVALID_WAVE
+            awg.queue.append((waveformNumber, triggerMode, startDelay, cycles, prescaler))
+        return 0
+
+    def AWGstart(self, nAWG):
+        awg, error = self._awg_call(nAWG)
+        if error:
+            return error
+        awg.running = True
+        return 0
+
+    def AWGstop(self, nAWG):
+        awg, error = self._awg_call(nAWG)
+        if error:
+            return error
+        awg.running = False
+        return 0
+
+    def AWGflush(self, nAWG):
+        awg, error = self._awg_call(nAWG)
+        if error:
+            return error
+        with self._lock:
+            awg.queue = []
+            awg.running = False
+        return 0
+
+    def AWGtrigger(self, nAWG):
+        awg, error = self._awg_call(nAWG)
+        if error:
+            return error
+        self._trigger(awg)
+        return 0
+
+    def _trigger(self, awg):
+        # Plays the next queued waveform of a running AWG (one-shot queues consume their entries)
+        with self._lock:
+            if not awg.running:
+                return
+            awg.triggers += 1
+            if awg.queue:
+                entry = awg.queue[0] if awg.queue_mode == SD_QueueMode.CYCLIC else awg.queue.pop(0)
+                if awg.queue_mode == SD_QueueMode.CYCLIC:
+                    awg.queue.append(awg.queue.pop(0))
+                if len(awg.played) < self.MAX_PLAYED:
+                    awg.played.append(entry[0])
+
+    def AWGisRunning(self, nAWG):
+        awg, error = self._awg_call(nAWG)
+        if error:
+            return error
+        return 1 if awg.running else 0
+
+    def triggerIOconfig(self, direction):
+        error = self._call()
+        if error:
+            return error
+        self.trigger_io["direction"] = direction
+        return 0
+
+    def triggerIOwrite(self, value, syncMode=1):
+        error = self._call()
+        if error:
+            return error
+        self.trigger_io["value"] = value
+        return 0
+
+    def _load(self, waveformObject, waveformNumber, replace):
+        if self.id is None:
+            sim_backend.latency.delay("call")
+            return SD_Error.MODULE_NOT_OPENED
+        if not isinstance(waveformObject, SD_Wave) or waveformObject.data is None or waveformNumber < 0:
+            sim_backend.latency.delay("call")
+            return SD_Error.INVALID_WAVE
+        sim_backend.latency.delay("waveform_load")
+        sim_backend.latency.delay("waveform_load_per_byte", waveformObject.nbytes)
+        with self._lock:
+            if not replace and waveformNumber in self.waveforms:
+                return SD_Error.INVALID_WAVE
+            self.waveforms[waveformNumber] = waveformObject
+        return waveformObject.nbytes // 8 # number of samples loaded
+
+    def waveformLoad(self, waveformObject, waveformNumber, paddingMode=0):
+        return self._load(waveformObject, waveformNumber, replace=False)
+
+    def waveformReLoad(self, waveformObject, waveformNumber, paddingMode=0):
+        return self._load(waveformObject, waveformNumber, replace=True)
+
+    def waveformFlush(self):
+        if self.id is None:
+            sim_backend.latency.delay("call")
+            return SD_Error.MODULE_NOT_OPENED
+        sim_backend.latency.delay("waveform_flush")
+        with self._lock:
+            self.waveforms = {}
+            for awg in self.awgs.values():
+                awg.queue = []
+        return 0
+
+
+class SD_AIN(SD_Module):
+
+    def _accepts(self, product_name):
+        return len(product_name) > 2 and product_name[2] == "1"
+
+    def _open_state(self):
+        self.daq_running = {}
+
+    def DAQstart(self, nDAQ):
+        error = self._call()
+        if error:
+            return error
+        self.daq_running[nDAQ] = True
+        return 0
+
+    def DAQstop(self, nDAQ):
+        error = self._call()
+        if error:
+            return error
+        self.daq_running[nDAQ] = False
+        return 0
+
+    def DAQflush(self, nDAQ):
+        return self._call() or 0
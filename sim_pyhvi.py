@@ -0,0 +1,447 @@
+import enum
+import sim_backend
+
+# Simulated pyhvi (see sim_backend.py). Covers the definition API hvi_configurator.lower_sequence() and the example
+# scripts use, compile/load_to_hw/run/release_hw and register access.
+#
+# A KtHvi records its statements in definition order. run() executes them until the first wait event; each event on
+# the awaited PXI line (see SimPlatform.pxi_write) resumes execution after the wait, up to the next wait or the end.
+# Jumps go back to the named statement ("Start" is the first one). Instructions that change state are executed:
+#   add              result_register = left_operand + right_operand
+#   queueWaveform    queues on the engine's AWG (no host latency)
+#   action_execute   awgN_trigger plays the next queued waveform of AWG N, awgN_start starts it
+#   trigger_write    records the value written to the engine trigger
+# Everything else (junctions, other instructions) only takes its place in the sequence.
+
+SIMULATED = True
+
+MAX_STEPS = 100000 # statements executed per event before a sequence without a wait is considered an endless loop
+
+
+class TriggerResourceId(enum.Enum):
+    PXI_TRIGGER0 = 0
+    PXI_TRIGGER1 = 1
+    PXI_TRIGGER2 = 2
+    PXI_TRIGGER3 = 3
+    PXI_TRIGGER4 = 4
+    PXI_TRIGGER5 = 5
+    PXI_TRIGGER6 = 6
+    PXI_TRIGGER7 = 7
+
+
+class SyncMode(enum.Enum):
+    IMMEDIATE = 0
+    SYNCHRONIZED = 1
+
+
+class TriggerPolarity(enum.Enum):
+    ACTIVE_HIGH = 0
+    ACTIVE_LOW = 1
+
+
+class TriggerValue(enum.Enum):
+    OFF = 0
+    ON = 1
+
+
+class TriggerMode(enum.Enum):
+    LEVEL = 0
+    PULSE = 1
+
+
+class DriveMode(enum.Enum):
+    PUSH_PULL = 0
+    OPEN_DRAIN = 1
+
+
+class Direction(enum.Enum):
+    INPUT = 0
+    OUTPUT = 1
+
+
+class EventDetectionMode(enum.Enum):
+    HIGH = 0
+    LOW = 1
+    ACTIVE = 2
+    INACTIVE = 3
+    TRANSITION_TO_ACTIVE = 4
+    TRANSITION_TO_INACTIVE = 5
+
+
+class RegisterSize(enum.Enum):
+    SHORT = 0
+    LONG = 1
+
+
+class ResourceId:
+    # Named resource of a module's HVI interface (engine, trigger, action, instruction set or instruction parameter).
+    # Any attribute is a child resource, so module.hvi.instructions.queueWaveform.waveformNumber.id works for every name
+    def __init__(self, name, module=None):
+        self.name = name
+        self.id = name
+        self.module = module
+
+    def __getattr__(self, attribute):
+        if attribute.startswith("_"):
+            raise AttributeError(attribute)
+        child = ResourceId(attribute, self.module)
+        self.__dict__[attribute] = child
+        return child
+
+    def __repr__(self):
+        return "ResourceId({})".format(self.name)
+
+
+def _resource_name(resource):
+    return getattr(resource, "name", resource)
+
+
+class ModuleHvi:
+    # module.hvi of an open simulated module
+    def __init__(self, module):
+        self.module = module
+        self.engines = ResourceId("engines", module)
+        self.triggers = ResourceId("triggers", module)
+        self.actions = ResourceId("actions", module)
+        self.instructions = ResourceId("instructions", module)
+
+
+class _Bag:
+    # Attribute container (trigger configuration, platform and synchronization settings)
+    pass
+
+
+class _Collection:
+
+    def __init__(self, hvi, factory):
+        self._hvi = hvi
+        self._factory = factory
+        self._items = []
+        self._by_name = {}
+
+    def add(self, *args):
+        sim_backend.latency.delay("define")
+        item = self._factory(*args)
+        self._items.append(item)
+        self._by_name[item.name] = item
+        self._hvi.compiled = False
+        return item
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self._items[key]
+        return self._by_name[key]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def count(self):
+        return len(self._items)
+
+
+class SimRegister:
+
+    def __init__(self, name, size=RegisterSize.SHORT):
+        self.name = name
+        self.size = size
+        self._value = 0
+
+    def read(self):
+        sim_backend.latency.delay("register_read")
+        with sim_backend.platform.lock:
+            return self._value
+
+    def write(self, value):
+        sim_backend.latency.delay("register_write")
+        with sim_backend.platform.lock:
+            self._value = value
+
+
+class SimResource:
+    # Engine event, trigger or action: a named use of a module resource
+    def __init__(self, source, name):
+        self.source = source
+        self.name = name
+        self.configuration = _Bag()
+        self.value = None
+        self.writes = 0
+
+
+class SimInstruction:
+
+    def __init__(self, name, time, instruction):
+        self.name = name
+        self.time = time
+        self.instruction = _resource_name(instruction)
+        self.parameters = {} # FORMAT: {PARAMETER NAME: VALUE}
+
+    def set_parameter(self, parameter, value):
+        sim_backend.latency.delay("define")
+        self.parameters[_resource_name(parameter)] = value
+
+
+class SimWaitEvent:
+
+    def __init__(self, name, time):
+        self.name = name
+        self.time = time
+        self.event = None
+        self.mode = None
+
+    def set_mode(self, detection, sync):
+        sim_backend.latency.delay("define")
+        self.mode = (detection, sync)
+
+
+class _SequenceProgramming:
+
+    def __init__(self, engine):
+        self._engine = engine
+
+    def add_instruction(self, name, time, instruction):
+        sim_backend.latency.delay("define")
+        statement = SimInstruction(name, time, instruction)
+        self._engine.hvi._add_statement("instruction", self._engine, statement)
+        return statement
+
+    def add_wait_event(self, name, time):
+        sim_backend.latency.delay("define")
+        statement = SimWaitEvent(name, time)
+        self._engine.hvi._add_statement("wait", self._engine, statement)
+        return statement
+
+
+class SimSequence:
+
+    def __init__(self, engine):
+        self.registers = _Collection(engine.hvi, SimRegister)
+        self.programming = _SequenceProgramming(engine)
+
+
+class SimEngine:
+
+    def __init__(self, hvi, engine_id, name):
+        if getattr(engine_id, "module", None) is None or not engine_id.module.isOpen():
+            raise RuntimeError("Engine {} does not belong to an open module".format(name))
+        self.hvi = hvi
+        self.name = name
+        self.module = engine_id.module
+        self.main_sequence = SimSequence(self)
+        self.events = _Collection(hvi, SimResource)
+        self.triggers = _Collection(hvi, SimResource)
+        self.actions = _Collection(hvi, SimResource)
+
+
+class _GlobalProgramming:
+
+    def __init__(self, hvi):
+        self._hvi = hvi
+
+    def add_junction(self, name, time):
+        sim_backend.latency.delay("define")
+        self._hvi._add_statement("junction", None, name)
+
+    def add_jump(self, name, time, destination):
+        sim_backend.latency.delay("define")
+        self._hvi._add_statement("jump", None, destination)
+
+    def add_end(self, name, time):
+        sim_backend.latency.delay("define")
+        self._hvi._add_statement("end", None, name)
+
+
+class _Chassis:
+
+    def __init__(self):
+        self.auto_detect = False
+        self.added = []
+
+    def add_auto_detect(self):
+        sim_backend.latency.delay("define")
+        self.auto_detect = True
+
+    def add_with_options(self, chassis, options=""):
+        sim_backend.latency.delay("define")
+        self.added.append(chassis)
+
+
+class _Interconnects:
+
+    def __init__(self):
+        self.squidboards = []
+
+    def add_squidboards(self, *args):
+        sim_backend.latency.delay("define")
+        self.squidboards.append(args)
+
+
+class KtHvi:
+
+    def __init__(self, resource_name):
+        sim_backend.latency.delay("define")
+        self.name = resource_name
+        self.platform = _Bag()
+        self.platform.sync_resources = []
+        self.platform.chassis = _Chassis()
+        self.platform.interconnects = _Interconnects()
+        self.synchronization = _Bag()
+        self.synchronization.non_hvi_core_clocks = []
+        self.engines = _Collection(self, lambda engine_id, name: SimEngine(self, engine_id, name))
+        self.instructions = ResourceId("instructions")
+        self.programming = _GlobalProgramming(self)
+        self.statements = [] # FORMAT: [(KIND, ENGINE or None, STATEMENT)] in definition order
+        self.compiled = False
+        self.loaded = False
+        self.running = False
+        self.events_received = 0
+        self._pc = 0
+
+    def __repr__(self):
+        return "<simulated KtHvi {} ({} engines, {} statements)>".format(self.name, self.engines.count, len(self.statements))
+
+    def _add_statement(self, kind, engine, statement):
+        self.statements.append((kind, engine, statement))
+        self.compiled = False
+
+    # ---------- Life cycle ----------
+
+    def compile(self):
+        sim_backend.latency.delay("compile")
+        sim_backend.latency.delay("compile_per_instruction", len(self.statements))
+        if self.engines.count == 0:
+            raise RuntimeError("KtHvi {} has no engines".format(self.name))
+        self.compiled = True
+
+    def load_to_hw(self):
+        if not self.compiled:
+            raise RuntimeError("KtHvi {} must be compiled before load_to_hw".format(self.name))
+        sim_backend.latency.delay("load_to_hw")
+        sim_backend.latency.delay("load_to_hw_per_engine", self.engines.count)
+        platform = sim_backend.platform
+        with platform.lock:
+            for resource in self.platform.sync_resources:
+                holder = platform.claimed_resources.get(resource)
+                if holder is not None and holder is not self and holder.running:
+                    raise RuntimeError("Sync resource {} is in use by another running KtHvi".format(resource))
+            for resource in self.platform.sync_resources:
+                platform.claimed_resources[resource] = self
+            self.loaded = True
+
+    def run(self, timeout=None):
+        if not self.loaded:
+            raise RuntimeError("KtHvi {} must be loaded before run".format(self.name))
+        sim_backend.latency.delay("run")
+        platform = sim_backend.platform
+        with platform.lock:
+            self.running = True
+            if self not in platform.running:
+                platform.running.append(self)
+            self._pc = 0
+            self._execute()
+
+    def stop(self):
+        sim_backend.latency.delay("run")
+        self._stop()
+
+    def _stop(self):
+        platform = sim_backend.platform
+        with platform.lock:
+            self.running = False
+            if self in platform.running:
+                platform.running.remove(self)
+
+    def release_hw(self):
+        sim_backend.latency.delay("release_hw")
+        self._stop()
+        platform = sim_backend.platform
+        with platform.lock:
+            for resource, holder in list(platform.claimed_resources.items()):
+                if holder is self:
+                    del platform.claimed_resources[resource]
+            self.loaded = False
+
+    # ---------- Execution (called with the platform lock held) ----------
+
+    def _sim_event(self, chassis, source):
+        if not self.running or self._pc >= len(self.statements):
+            return
+        kind, engine, statement = self.statements[self._pc]
+        if kind != "wait" or statement.event is None or engine.module.chassis != chassis:
+            return
+        if _resource_name(statement.event.source) != source:
+            return
+        self.events_received += 1
+        self._pc += 1
+        self._execute()
+
+    def _execute(self):
+        # Runs from the current statement until a wait event or the end
+        for _ in range(0, MAX_STEPS):
+            if self._pc >= len(self.statements):
+                self._stop()
+                return
+            kind, engine, statement = self.statements[self._pc]
+            if kind == "wait":
+                return
+            if kind == "end":
+                self._stop()
+                return
+            if kind == "jump":
+                self._pc = self._jump_target(statement)
+                continue
+            if kind == "instruction":
+                self._execute_instruction(engine, statement)
+            self._pc += 1
+        print("[ERROR] sim_pyhvi.KtHvi: {} ran {} statements without waiting for an event, stopping it".format(self.name, MAX_STEPS))
+        self._stop()
+
+    def _jump_target(self, destination):
+        if destination == "Start":
+            return 0
+        for index, (kind, engine, statement) in enumerate(self.statements):
+            if _resource_name(getattr(statement, "name", statement)) == destination:
+                return index
+        raise RuntimeError("KtHvi {} jumps to unknown statement {}".format(self.name, destination))
+
+    def _execute_instruction(self, engine, instruction):
+        value = lambda parameter: _value(instruction.parameters.get(parameter))
+        if instruction.instruction == "add":
+            instruction.parameters["result_register"]._value = value("left_operand") + value("right_operand")
+        elif instruction.instruction == "queueWaveform":
+            engine.module._queue_waveform(value("channel"), value("waveformNumber"), value("triggerMode"),
+                                          value("startDelay"), value("cycles"), value("prescaler"))
+        elif instruction.instruction == "action_execute":
+            for action in instruction.parameters.get("action", []):
+                _execute_action(engine.module, _resource_name(action.source))
+        elif instruction.instruction == "trigger_write":
+            trigger = instruction.parameters["trigger"]
+            trigger.value = instruction.parameters.get("value")
+            trigger.writes += 1
+
+
+def _value(parameter):
+    if isinstance(parameter, SimRegister):
+        return parameter._value
+    return parameter
+
+
+def _execute_action(module, action):
+    # awg<N>_trigger / awg<N>_start on the module's AWG N
+    if not action.startswith("awg") or "_" not in action or not hasattr(module, "awgs"):
+        return
+    number, operation = action[3:].split("_", 1)
+    if not number.isdigit():
+        return
+    awg = module._awg(int(number))
+    if awg is None:
+        return
+    if operation == "trigger":
+        module._trigger(awg)
+    elif operation == "start":
+        awg.running = True
+    elif operation == "stop":
+        awg.running = False
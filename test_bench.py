@@ -1,15 +1,31 @@
 import sys
 import time
+import argparse
 sys.path.append('C:/Program Files (x86)/Keysight/SD1/Libraries/Python')
+
+# --simulate has to take effect before anything imports keysightSD1/pyhvi (see sim_backend.py)
+if '--simulate' in sys.argv:
+    import sim_backend
+    scale = sys.argv[sys.argv.index('--sim-latency-scale') + 1] if '--sim-latency-scale' in sys.argv else 1.0
+    sim_backend.install(sim_backend.LatencyModel(scale=float(scale)))
+
 from hardware_configurator import *
 from test_initialization import *
 from hvi_configurator import *
+from module_pool import ModulePool
+from bench_pipeline import run_pipelined, print_pipeline_report
+from tracing import tracer
+from driver_profiler import driver_profiler
+from waveform_table import WaveformTable
 
 module_1 = [1, 7]
 module_2 = [1, 10]
 master_module_location = [1, 7]
 trigger_module_location = [1, 8]
 
+# Fast branching triggers fired by --pipelined when --triggers is not given (that mode never prompts)
+PIPELINED_TRIGGERS = 10
+
 # Create array of module locations [chassis, slot]. Doesn't matter what type of SD1 instrument (dig/awg)
 module_array = [module_1, module_2]
 
@@ -23,8 +39,97 @@ module_array = [module_1, module_2]
 
 
 
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--refresh-inventory', help='Ignore the cached module inventory and re-query every slot (use after swapping modules)', action='store_true')
+    parser.add_argument('--discover', help='Probe every slot of every detected chassis instead of using module_array', action='store_true')
+    parser.add_argument('--compare-open', help='Open the modules serially and then concurrently, print the speedup and exit', action='store_true')
+    parser.add_argument('--concurrent-helloworld', help='Compile the per-module helloworld HVIs in parallel and load/run them at the same time', action='store_true')
+    parser.add_argument('--pipelined', help='Run the four tests without prompts, building and compiling the next test while the current one is on hardware (fast branching fires --triggers triggers, {} by default)'.format(PIPELINED_TRIGGERS), action='store_true')
+    parser.add_argument('--triggers', help='Fire this many fast branching triggers automatically instead of prompting for each one', type=int, default=None)
+    parser.add_argument('--trigger-rate', help='Trigger rate in triggers/s for --triggers (default: as fast as possible)', type=float, default=None)
+    parser.add_argument('--simulate', help='Run on the simulated keysightSD1/pyhvi backend instead of hardware', action='store_true')
+    parser.add_argument('--sim-latency-scale', help='With --simulate, multiply every simulated driver latency by this factor (0: no latency)', type=float, default=1.0)
+    parser.add_argument('--concurrent-register-writes', help='Write the WfNum register of the fast branching engines in parallel', action='store_true')
+    parser.add_argument('--poll-rate', help='With --triggers, sample cycleCnt/WfNum on a background poller at this rate (samples/s) instead of reading cycleCnt after every trigger', type=float, default=None)
+    parser.add_argument('--trace', help='Record timing spans of every test phase and write them to this file as a Chrome trace (chrome://tracing, ui.perfetto.dev)', default=None)
+    parser.add_argument('--profile-drivers', help='Count and time every keysightSD1/pyhvi call and print the N most expensive at the end', type=int, nargs='?', const=20, default=None, metavar='N')
+    parser.add_argument('--profile-call-sites', help='With --profile-drivers, count every driver call separately per bench file and line that made it', action='store_true')
+    parser.add_argument('--waveforms', help='Fast branching waveform files (SD1 CSV or .hvw) to branch between, loaded as waveforms 1..N', nargs='+', default=None)
+    parser.add_argument('--waveform-count', help='Branch between this many generated pulse waveforms instead of the pulse and ramp', type=int, default=None)
+    return parser.parse_args()
+
+args = parse_args()
+test_fastbranching.concurrent_register_writes = args.concurrent_register_writes
+if args.waveforms:
+    test_fastbranching.waveform_table = WaveformTable.from_files(args.waveforms)
+    if len(test_fastbranching.waveform_table) == 0:
+        print("[ERROR] test_bench: none of the --waveforms files could be loaded")
+        sys.exit(1)
+elif args.waveform_count:
+    test_fastbranching.waveform_table = WaveformTable.pulse_widths(args.waveform_count)
+if args.trace:
+    tracer.enable()
+if args.profile_drivers is not None:
+    driver_profiler.install(call_sites=args.profile_call_sites)
+
+
+def drive_fastbranching(test, triggers=None):
+    # With --triggers (or a trigger count), fire the triggers headless and report; otherwise prompt for each trigger
+    if args.triggers is not None:
+        triggers = args.triggers
+    if triggers is not None:
+        print_trigger_report(test.run_triggers(triggers, args.trigger_rate, poll_rate=args.poll_rate))
+    else:
+        test.loop()
+
 # Use the inventory function to get more info about modules (instrument type, name, etc.)
-module_dict = create_module_inventory(module_array)
+# With --discover, every slot of every chassis is probed instead (the trigger module is left out of the tests)
+if args.discover:
+    module_dict = discover_modules(exclude=[trigger_module_location])
+else:
+    module_dict = create_module_inventory(module_array, refresh=args.refresh_inventory)
+
+if args.compare_open:
+    compare_module_open(module_dict)
+    sys.exit()
+
+# Open every module once for the whole session. Each test borrows the modules from the pool and hands them back (reset,
+# still open) in close_modules(), so the modules are not re-opened for every test
+module_pool = ModulePool(module_dict)
+
+if args.pipelined:
+    master_location = {"chassis": master_module_location[0], "slot": master_module_location[1]}
+
+    def make_helloworld():
+        test = test_helloworld(module_dict, pool=module_pool)
+        test.concurrent_hvi = args.concurrent_helloworld
+        return test
+
+    def hold_fastbranching(test):
+        test.setup_ext_trig_module(trigger_module_location)
+        test.seq_master.registers["cycleCnt"].write(0)
+        drive_fastbranching(test, PIPELINED_TRIGGERS)
+
+    report = run_pipelined([make_helloworld,
+                            lambda: test_helloworldmimo(module_dict, pool=module_pool),
+                            lambda: test_mimoresync(module_dict, master_location, pool=module_pool),
+                            lambda: test_fastbranching(module_dict, master_location, pool=module_pool)],
+                           hold={"helloworld": lambda test: time.sleep(1),
+                                 "helloworldmimo": lambda test: time.sleep(1),
+                                 "mimoresync": lambda test: time.sleep(1),
+                                 "fastbranching": hold_fastbranching})
+    module_pool.close()
+    print_pipeline_report(report)
+    print(hvi_cache.report())
+    if args.simulate:
+        print(sim_backend.latency.report())
+    if args.trace:
+        tracer.export(args.trace)
+        print(tracer.report())
+    if args.profile_drivers is not None:
+        print(driver_profiler.report(args.profile_drivers))
+    sys.exit()
 
 
 # HelloWorld compiles and runs an HVI sequence consisting in a turning ON and OFF a trigger.
@@ -64,7 +169,8 @@ if ctrl == 'q':
     sys.exit
 
 # set up test object
-hello_world_test = test_helloworld(module_dict)
+hello_world_test = test_helloworld(module_dict, pool=module_pool)
+hello_world_test.concurrent_hvi = args.concurrent_helloworld
 
 # run the hardware configurator
 configure_hardware(hello_world_test)
@@ -74,12 +180,14 @@ configure_hvi(hello_world_test)
 
 # run the HVIs
 hello_world_test.run_each_hvi()
+for result in hello_world_test.hvi_results:
+    print("{}: {} (compile {:.3f} s, load {:.3f} s, run {:.3f} s)".format(result["module"], "PASS" if result["passed"] else "FAIL",
+          result["compile_time"] or 0, result["load_time"] or 0, result["run_time"] or 0))
 
 # release the HVIs
 time.sleep(1)
 hello_world_test.release_hvi()
 hello_world_test.close_modules()
-time.sleep(1)
 
 
 # HVI Hello World MIMO
@@ -121,7 +229,7 @@ if ctrl == 'q':
     sys.exit
 
 # create new test object
-hello_world_mimo_test = test_helloworldmimo(module_dict)
+hello_world_mimo_test = test_helloworldmimo(module_dict, pool=module_pool)
 
 # run the hardware configurator
 configure_hardware(hello_world_mimo_test)
@@ -136,7 +244,6 @@ hello_world_mimo_test.run_hvi()
 time.sleep(1)
 hello_world_mimo_test.release_hvi()
 hello_world_mimo_test.close_modules()
-time.sleep(1)
 
 
 # MimoResync compiles and runs two HVI sequences in two SD1 modules.
@@ -192,7 +299,7 @@ if ctrl == 'q':
     sys.exit
 
 # create new test object
-mimo_resync_test = test_mimoresync(module_dict, {"chassis": master_module_location[0], "slot": master_module_location[1]})
+mimo_resync_test = test_mimoresync(module_dict, {"chassis": master_module_location[0], "slot": master_module_location[1]}, pool=module_pool)
 
 # run the hardware configurator
 configure_hardware(mimo_resync_test)
@@ -208,7 +315,6 @@ input()
 time.sleep(1)
 mimo_resync_test.release_hvi()
 mimo_resync_test.close_modules()
-time.sleep(1)
 
 
 
@@ -268,7 +374,7 @@ if ctrl == 'q':
     sys.exit
 
 # create new test object
-fast_branching_test = test_fastbranching(module_dict, {"chassis": master_module_location[0], "slot": master_module_location[1]})
+fast_branching_test = test_fastbranching(module_dict, {"chassis": master_module_location[0], "slot": master_module_location[1]}, pool=module_pool)
 
 # run the hardware configurator
 configure_hardware(fast_branching_test)
@@ -285,14 +391,22 @@ fast_branching_test.setup_ext_trig_module(trigger_module_location)
 # configure the test register
 fast_branching_test.seq_master.registers["cycleCnt"].write(0)
 
-# continuously loop through the test waveforms until user presses 'q'
-fast_branching_test.loop()
+# continuously loop through the test waveforms until user presses 'q' (or fire --triggers triggers)
+drive_fastbranching(fast_branching_test)
 
 # release the HVI
 time.sleep(1)
 fast_branching_test.release_hvi()
 fast_branching_test.close_modules()
-time.sleep(1)
+module_pool.close()
+print(hvi_cache.report())
+if args.simulate:
+    print(sim_backend.latency.report())
+if args.trace:
+    tracer.export(args.trace)
+    print(tracer.report())
+if args.profile_drivers is not None:
+    print(driver_profiler.report(args.profile_drivers))
 
 """
 DONE!
@@ -1,7 +1,17 @@
 import sys
 sys.path.append('C:/Program Files (x86)/Keysight/SD1/Libraries/Python')
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait
 import keysightSD1
+import math
+import time
+from inventory_cache import DEFAULT_CACHE_FILE, lookup_inventory
+from hvi_cache import hvi_cache
+from trigger_scheduler import TriggerScheduler
+from register_poller import RegisterPoller
+from register_bank import RegisterBank
+from hardware_configurator import fast_branching_table
+from tracing import tracer
 from datetime import timedelta
 import numpy
 
@@ -17,28 +27,70 @@ class Test(ABC):
     # module_instances = [] # FORMAT: [INSTANCE, MODULE NAME, [CHASSIS SLOT]]
     # #========================================================================#
 
+    # Modules are opened on a bounded thread pool by default (see open_modules). Set concurrent_open = False to fall
+    # back to the one-at-a-time open path
+    concurrent_open = True
+    max_open_workers = 8
+
     # init method will fill _module_instances list with SD objects specified by locations in module_dict
+    # If a ModulePool (module_pool.py) is passed in, the modules are borrowed from it instead of being opened here
     @abstractmethod
-    def __init__(self, module_dict):
+    def __init__(self, module_dict, pool=None):
         super().__init__()
         self.module_dict = {}
         self.module_instances = []
+        self.open_errors = {} # FORMAT: {MODULE NAME: ERROR CODE} for every module that failed to open
+        self.open_time = None # wall-clock seconds spent opening the modules
         self.module_dict = module_dict
-        for key, value in self.module_dict.items():
-            if key[2] == '1':
-                sd1_obj = keysightSD1.SD_AIN()
-                sd1_obj_id = sd1_obj.openWithSlot("", value[0], value[1])
-                if sd1_obj_id < 0:
-                    print("[ERROR] Test.__init__: Error opening {}".format(key))
-                self.module_instances.append([sd1_obj, key, value])
-            elif key[2] == '2':
-                sd1_obj = keysightSD1.SD_AOU()
-                sd1_obj_id = sd1_obj.openWithSlot("", value[0], value[1])
-                if sd1_obj_id < 0:
-                    print("[ERROR] Test.__init__: Error opening {}".format(key))
-                self.module_instances.append([sd1_obj, key, value])
+        self.pool = pool
+        with tracer.span("open", test=self.test_key, modules=len(module_dict), pooled=pool is not None):
+            if self.pool is None:
+                self.module_instances, self.open_errors, self.open_time = open_modules(self.module_dict, self.concurrent_open,
+                                                                                      self.max_open_workers)
+            else:
+                start = time.perf_counter()
+                self.module_instances, self.open_errors = self.pool.lend(self.module_dict)
+                self.open_time = time.perf_counter() - start
+        # Modules that failed to open stay in module_instances, as before; report them whichever way they were opened
+        for key, code in self.open_errors.items():
+            print("[ERROR] Test.__init__: Error opening {} ({})".format(key, code))
+
+    # Modules borrowed from a ModulePool are handed back (reset, still open); modules opened by the test are closed
+    def close_modules(self):
+        with tracer.span("close", test=self.test_key, pooled=self.pool is not None):
+            if self.pool is not None:
+                self.pool.give_back(self.module_instances)
             else:
-                print("[ERROR] Test.__init__: Did not properly parse instrument type string.")
+                for module_inst in self.module_instances:
+                    module_inst[0].close()
+
+    # KtHvi instances of the test with their hvi_cache keys (test_helloworld has one per module)
+    def hvi_entries(self):
+        return [(self.hvi, self.hvi_key)]
+
+    # Compiles the test's KtHvi instance(s) without touching the hardware, so it can be done ahead of time while another
+    # test is running (see bench_pipeline.py). run_hvi() then finds them compiled in hvi_cache
+    def compile_hvi(self):
+        for hvi, hvi_key in self.hvi_entries():
+            with tracer.span("compile", test=self.test_key) as span:
+                span.set(cached=hvi_cache.compile(hvi, hvi_key, self))
+
+    # run_hvi() = compile_hvi() (skipped if already compiled), load_hvi() and start_hvi(). The steps can also be called
+    # one by one, e.g. to time them separately (see bench_phases.py)
+    def run_hvi(self):
+        self.compile_hvi()
+        self.load_hvi()
+        return self.start_hvi()
+
+    # Loads the test's KtHvi instance(s) to HW: load sequence(s), config triggers/events/..., lock resources, etc
+    @abstractmethod
+    def load_hvi(self):
+        pass
+
+    # Executes the loaded KtHvi instance(s)
+    @abstractmethod
+    def start_hvi(self):
+        pass
 
     # @abstractmethod
     # def _associate(self):
@@ -59,26 +111,108 @@ class test_helloworld(Test):
     # Attributes accessible through class methods
     number_modules = None
     hvi_instances = []
+    hvi_keys = [] # hvi_cache key of each entry in hvi_instances
+    hvi_results = [] # per-module results of the last run_each_hvi, see _new_hvi_result
 
+    # With concurrent_hvi = True the per-module KtHvi instances are compiled on a thread pool and then loaded and run
+    # at the same time. The instances are independent (one engine each), so in this mode the configurator builds them
+    # without sync resources, which would otherwise make every instance claim the same PXI trigger lines
+    concurrent_hvi = False
+    max_hvi_workers = 8
 
-    def __init__(self, module_dict):
-        super().__init__(module_dict)
+
+    def __init__(self, module_dict, pool=None):
+        super().__init__(module_dict, pool)
         self.number_modules = len(module_dict)
+        self.hvi_instances = []
+        self.hvi_keys = []
+        self.hvi_results = []
+
+    def _new_hvi_result(self, index):
+        return {"module": self.module_instances[index][1], "passed": True, "error": None,
+                "compile_time": None, "load_time": None, "run_time": None}
+
+    def _hvi_phase(self, index, phase, call):
+        # Runs one phase (compile/load/run) of one instance, recording its time and the first failure
+        result = self.hvi_results[index]
+        if not result["passed"]:
+            return
+        start = time.perf_counter()
+        try:
+            with tracer.span("load_to_hw" if phase == "load" else phase, test=self.test_key, module=result["module"]):
+                call()
+        except Exception as ex:
+            result["passed"] = False
+            result["error"] = "{}: {}".format(phase, ex)
+        result[phase + "_time"] = time.perf_counter() - start
+
+    def _compile_one(self, index):
+        self._hvi_phase(index, "compile", lambda: hvi_cache.compile(self.hvi_instances[index], self.hvi_keys[index], self))
+
+    def _load_one(self, index):
+        self._hvi_phase(index, "load", self.hvi_instances[index].load_to_hw)
+
+    def _run_one(self, index):
+        self._hvi_phase(index, "run", lambda: self.hvi_instances[index].run(timedelta(seconds=1)))
+
+    def _load_and_run_one(self, index):
+        self._load_one(index)
+        self._run_one(index)
+
+    def _each_hvi(self, call, concurrent=None):
+        # Calls call(index) for every per-module instance, all at once with concurrent_hvi
+        if concurrent is None:
+            concurrent = self.concurrent_hvi
+        if concurrent and len(self.hvi_instances) > 1:
+            with ThreadPoolExecutor(max_workers=len(self.hvi_instances)) as pool:
+                list(pool.map(call, range(len(self.hvi_instances))))
+        else:
+            for index in range(len(self.hvi_instances)):
+                call(index)
+
+    def _check_hvi_results(self):
+        for result in self.hvi_results:
+            if not result["passed"]:
+                print("[ERROR] test_helloworld.run_each_hvi: {} failed in {}".format(result["module"], result["error"]))
+        return all(result["passed"] for result in self.hvi_results)
+
+    def run_each_hvi(self, concurrent=None):
+        # Compiles, loads and runs every per-module KtHvi instance and fills hvi_results. Returns True if all passed
+        if concurrent is None:
+            concurrent = self.concurrent_hvi
+        self.hvi_results = [self._new_hvi_result(index) for index in range(len(self.hvi_instances))]
+
+        if concurrent and len(self.hvi_instances) > 1:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_hvi_workers, len(self.hvi_instances)))) as pool:
+                list(pool.map(self._compile_one, range(len(self.hvi_instances))))
+            # Load and run every instance at once, so the 1 s runs overlap instead of adding up
+            self._each_hvi(self._load_and_run_one, True)
+        else:
+            for index in range(len(self.hvi_instances)):
+                self._compile_one(index)  # Compile the instrument sequence(s), unless this instance was compiled before
+                self._load_and_run_one(index)  # Load the instrument sequence(s) to HW and execute them
+        return self._check_hvi_results()
+
+    def hvi_entries(self):
+        return list(zip(self.hvi_instances, self.hvi_keys))
 
-    def run_each_hvi(self):
-        for hvi in self.hvi_instances:
-            hvi.compile()  # Compile the instrument sequence(s)
-            hvi.load_to_hw()  # Load the instrument sequence(s) to HW
-            time = timedelta(seconds=1)
-            hvi.run(time)  # Execute the instrument sequence(s)
+    def run_hvi(self):
+        return self.run_each_hvi()
+
+    def load_hvi(self):
+        # Starts a new hvi_results (compile_hvi() does not record one)
+        self.hvi_results = [self._new_hvi_result(index) for index in range(len(self.hvi_instances))]
+        self._each_hvi(self._load_one)
+
+    def start_hvi(self):
+        self._each_hvi(self._run_one)
+        return self._check_hvi_results()
 
     def release_hvi(self):
-        for hvi in self.hvi_instances:
-            hvi.release_hw()
+        for hvi, mod_inst in zip(self.hvi_instances, self.module_instances):
+            with tracer.span("release_hw", test=self.test_key, module=mod_inst[1]):
+                hvi.release_hw()
 
-    def close_modules(self):
-        for module in self.module_instances:
-            module[0].close()
 
 class test_helloworldmimo(Test):
     # Dummy attributes
@@ -90,28 +224,27 @@ class test_helloworldmimo(Test):
     # Attributes accessible through class methods
     number_modules = None
     hvi = None #This gets set in the hvi_configurator
+    hvi_key = None #hvi_cache key of hvi, also set in the hvi_configurator
 
-    def __init__(self, module_dict):
-        super().__init__(module_dict)
+    def __init__(self, module_dict, pool=None):
+        super().__init__(module_dict, pool)
         self.number_modules = len(module_dict)
 
-    def run_hvi(self):
-        # Compile the instrument sequence(s)
-        self.hvi.compile()
-
+    def load_hvi(self):
         # Load the KtHvi instance to HW: load sequence(s), config triggers/events/..., lock resources, etc
-        self.hvi.load_to_hw()
+        with tracer.span("load_to_hw", test=self.test_key, engines=self.number_modules):
+            self.hvi.load_to_hw()
 
+    def start_hvi(self):
          # Execute KtHvi instance
         time = timedelta(seconds=1)
-        self.hvi.run(time)
+        with tracer.span("run", test=self.test_key):
+            self.hvi.run(time)
 
     def release_hvi(self):
-        self.hvi.release_hw()
+        with tracer.span("release_hw", test=self.test_key):
+            self.hvi.release_hw()
 
-    def close_modules(self):
-        for module in self.module_instances:
-            module[0].close()
 
 
 class test_mimoresync(Test):
@@ -125,26 +258,27 @@ class test_mimoresync(Test):
     number_modules = None # set in init()
     chassis_list = [] # set in init()
     hvi = None #This gets set in the hvi_configurator
+    hvi_key = None #hvi_cache key of hvi, also set in the hvi_configurator
     master_module_index = None #set in init()
 
-    def __init__(self, module_dict, master_module_location): #master_module_location is a dict {chassis: x, slot: y}
-        super().__init__(module_dict)
+    def __init__(self, module_dict, master_module_location, pool=None): #master_module_location is a dict {chassis: x, slot: y}
+        super().__init__(module_dict, pool)
         self.number_modules = len(module_dict)
         for i in range(0, self.number_modules):
             self.chassis_list.append(self.module_instances[i][2][1])
             if master_module_location["chassis"] == self.module_instances[i][2][0] and master_module_location["slot"] == self.module_instances[i][2][1]:
                 self.master_module_index = i
 
-    def run_hvi(self):
-        # Compile the instrument sequence(s)
-        self.hvi.compile()
-
+    def load_hvi(self):
         # Load the KtHvi instance to HW: load sequence(s), config triggers/events/..., lock resources, etc
-        self.hvi.load_to_hw()
+        with tracer.span("load_to_hw", test=self.test_key, engines=self.number_modules):
+            self.hvi.load_to_hw()
 
+    def start_hvi(self):
          # Execute KtHvi instance
         time = timedelta(seconds=0)
-        self.hvi.run(time)
+        with tracer.span("run", test=self.test_key):
+            self.hvi.run(time)
 
     # def send_triggers(self):
     #     print("Press enter to trigger the sequence. 's' to stop")
@@ -155,11 +289,9 @@ class test_mimoresync(Test):
     #         self.
 
     def release_hvi(self):
-        self.hvi.release_hw()
+        with tracer.span("release_hw", test=self.test_key):
+            self.hvi.release_hw()
 
-    def close_modules(self):
-        for module in self.module_instances:
-            module[0].close()
 
 
 class test_fastbranching(Test):
@@ -173,32 +305,52 @@ class test_fastbranching(Test):
     number_modules = None # set in init()
     chassis_list = [] # set in init()
     hvi = None #This gets set in the hvi_configurator
+    hvi_key = None #hvi_cache key of hvi, also set in the hvi_configurator
     master_module_index = None #set in init()
     seq_master = None #set at end of hvi_configurator
     extTrigModule = keysightSD1.SD_AOU()
+    nWfm = 2 #number of waveforms the WfNum register rotates through, len(waveform_table)
+    waveform_table = None #WaveformTable (waveform_table.py) to branch between; None: fast_branching_table(), pulse and ramp
+    register_bank = None #WfNum handles of every engine, resolved in load_hvi() after compile
+    concurrent_register_writes = False #write the engines' registers in parallel (see register_bank.py)
 
-    def __init__(self, module_dict, master_module_location): #master_module_location is a dict {chassis: x, slot: y}
-        super().__init__(module_dict)
+    def __init__(self, module_dict, master_module_location, pool=None): #master_module_location is a dict {chassis: x, slot: y}
+        super().__init__(module_dict, pool)
         self.number_modules = len(module_dict)
         for i in range(0, self.number_modules):
             self.chassis_list.append(self.module_instances[i][2][1])
             if master_module_location["chassis"] == self.module_instances[i][2][0] and master_module_location["slot"] == self.module_instances[i][2][1]:
                 self.master_module_index = i
+        if self.waveform_table is None:
+            self.waveform_table = fast_branching_table()
+        if len(self.waveform_table) == 0:
+            raise ValueError("test_fastbranching: the waveform table is empty, there is nothing to branch between")
+        self.nWfm = len(self.waveform_table)
 
 
-    def run_hvi(self):
-        # Compile the instrument sequence(s)
-        self.hvi.compile()
+    def load_hvi(self):
+        # Resolve the WfNum register of every engine once, so each waveform selection only writes. A bank left from an
+        # earlier load is closed first, so its write pool does not leak
+        if self.register_bank is not None:
+            self.register_bank.close()
+        self.register_bank = RegisterBank(self.hvi, ["WfNum"], concurrent=self.concurrent_register_writes)
 
         # Load the KtHvi instance to HW: load sequence(s), config triggers/events/..., lock resources, etc
-        self.hvi.load_to_hw()
+        with tracer.span("load_to_hw", test=self.test_key, engines=self.number_modules):
+            self.hvi.load_to_hw()
 
+    def start_hvi(self):
          # Execute KtHvi instance
         time = timedelta(seconds=0)
-        self.hvi.run(time)
+        with tracer.span("run", test=self.test_key):
+            self.hvi.run(time)
 
     def release_hvi(self):
-        self.hvi.release_hw()
+        if self.register_bank is not None:
+            self.register_bank.close()
+            self.register_bank = None
+        with tracer.span("release_hw", test=self.test_key):
+            self.hvi.release_hw()
 
     def setup_ext_trig_module(self, trig_mod_location):
 
@@ -216,20 +368,23 @@ class test_fastbranching(Test):
         moduleAOU.PXItriggerWrite(keysightSD1.SD_TriggerExternalSources.TRIGGER_PXI2, keysightSD1.SD_TriggerValue.LOW)
         moduleAOU.PXItriggerWrite(keysightSD1.SD_TriggerExternalSources.TRIGGER_PXI2, keysightSD1.SD_TriggerValue.HIGH)
 
-    def close_modules(self):
-        for module_inst in self.module_instances:
-            module_inst[0].close()
+
+    def select_waveform(self, wfNum):
+        # Writes WfNum on every engine. Returns the seconds the update took
+        if self.register_bank is None:
+            self.register_bank = RegisterBank(self.hvi, ["WfNum"], concurrent=self.concurrent_register_writes)
+        return self.register_bank.broadcast("WfNum", wfNum)
+
+    def next_waveform(self, wfNum):
+        # Change wfNum at each iteration, in waveform table order (precomputed, see WaveformTable.next_number)
+        return self.waveform_table.next_number(wfNum)
 
     def loop(self):
-        wfNum = 1
-        nWfm = 2
+        wfNum = self.waveform_table.numbers[0]
 
         # Loop as many times as desired, press q to exit
         while True:
-            for index in range(0, self.hvi.engines.count):
-                engine = self.hvi.engines[index]
-                seq = engine.main_sequence
-                seq.registers["WfNum"].write(wfNum)
+            self.select_waveform(wfNum)
 
             print(
                 "N. of external triggers received at Module0: cycleCnt = {}".format(self.seq_master.registers["cycleCnt"].read()))
@@ -242,29 +397,231 @@ class test_fastbranching(Test):
             else:
                 self.triggerPXI2(self.extTrigModule)
 
-            # Change wfNum at each iteration
-            if (wfNum >= nWfm):  # general case of nWfm
-                wfNum = 1
-            else:
-                wfNum = wfNum + 1
+            wfNum = self.next_waveform(wfNum)
 
             # Release HVI instance from HW (unlock resources)
         print("Exiting...")
 
-
-def create_module_inventory(module_array):
+    def run_triggers(self, count, rate=None, confirm_timeout=0.01, cpu=None, poll_rate=None, order=None):
+        # Non-interactive version of loop(): fires count PXI2 triggers, rotating WfNum the same way, at rate triggers/s
+        # or as fast as possible (rate=None). With order, a list of waveform numbers (e.g. from
+        # WaveformTable.numbers_for), trigger i plays order[i % len(order)] instead. The triggers are paced by a TriggerScheduler (trigger_scheduler.py), on a
+        # worker thread pinned to cpu if given.
+        # By default, after each trigger cycleCnt is polled until it counts the trigger or confirm_timeout seconds pass;
+        # a trigger that cycleCnt did not count in time is reported as missed. With poll_rate (samples/s), cycleCnt and
+        # WfNum are sampled by a background RegisterPoller (register_poller.py) instead, and the trigger path only
+        # records the trigger time; the poller then matches counts to triggers.
+        # Returns {"triggers", "missed", "seconds", "rate" (achieved triggers/s), "latencies" (host seconds per
+        # iteration), "schedule" (ScheduleResult, trigger timestamps/jitter) and, with poll_rate, "poller"}
+        cycleCnt = self.seq_master.registers["cycleCnt"]
+        state = {"wfNum": self.waveform_table.numbers[0], "expected": cycleCnt.read(), "missed": 0}
+        latencies = []
+        poller = None
+        if poll_rate:
+            poller = RegisterPoller(self.seq_master.registers, ["cycleCnt", "WfNum"], rate=poll_rate)
+
+        def fire(index):
+            iteration_start = time.perf_counter()
+            self.select_waveform(order[index % len(order)] if order else state["wfNum"])
+            trigger_start = time.perf_counter()
+            self.triggerPXI2(self.extTrigModule)
+            if poller is not None:
+                poller.mark_trigger(trigger_start)
+            else:
+                state["expected"] += 1
+                received = cycleCnt.read()
+                while received < state["expected"] and time.perf_counter() - iteration_start < confirm_timeout:
+                    received = cycleCnt.read()
+                if received < state["expected"]:
+                    state["missed"] += 1
+                state["expected"] = received # count each missed trigger once
+            latencies.append(time.perf_counter() - iteration_start)
+            state["wfNum"] = self.next_waveform(state["wfNum"])
+            return None, trigger_start # the trigger write, not the start of the iteration, is the trigger's timestamp
+
+        scheduler = TriggerScheduler(1.0 / rate if rate else 0, count, cpu=cpu)
+        if poller is not None:
+            poller.start()
+        if cpu is not None:
+            scheduler.start(fire)
+            schedule = scheduler.join()
+        else:
+            schedule = scheduler.run(fire)
+
+        report = {"triggers": count, "missed": state["missed"], "seconds": schedule.seconds,
+                  "rate": count / schedule.seconds if schedule.seconds > 0 else 0.0, "latencies": latencies,
+                  "schedule": schedule, "register_bank": self.register_bank}
+        if poller is not None:
+            poller.stop()
+            report["missed"] = poller.missed + poller.stats()["pending"]
+            report["poller"] = poller
+        return report
+
+
+def print_trigger_report(report):
+    latencies = sorted(report["latencies"])
+    print("Fired {} triggers in {:.3f} s ({:.1f} triggers/s), {} missed".format(
+        report["triggers"], report["seconds"], report["rate"], report["missed"]))
+    if latencies:
+        print("Host latency per trigger: mean {:.1f} us, median {:.1f} us, p99 {:.1f} us, max {:.1f} us".format(
+            1e6 * sum(latencies) / len(latencies), 1e6 * latencies[len(latencies) // 2],
+            1e6 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 1e6 * latencies[-1]))
+    if report.get("register_bank") is not None:
+        print(report["register_bank"].report())
+    if "schedule" in report:
+        print(report["schedule"])
+    if "poller" in report:
+        print(report["poller"].report())
+
+
+def create_module_inventory(module_array, refresh=False, cache_file=DEFAULT_CACHE_FILE):
     # Takes array of module locations in format [chassis, slot], and returns a dictionary of modules with specific module type & location information
+    # Slot information comes from the on-disk inventory cache (see inventory_cache.py) when it is still valid; pass
+    # refresh=True to re-query every slot, e.g. after modules were swapped
 
     dictionary = {}
 
-    for mod in module_array:
-        temp_mod = keysightSD1.SD_AOU() #Doesn't matter if it's dig or awg, it will be able to retrieve module name
-        module_type = temp_mod.getProductNameBySlot(mod[0], mod[1])
+    for mod, record in zip(module_array, lookup_inventory(module_array, refresh, cache_file)):
+        if record is None:
+            print("[ERROR] test_initialization.create_module_inventory: No module found in Chassis {}, Slot {}".format(mod[0], mod[1]))
+            continue
+        module_type = record["product_name"]
 
         print("Found {} in Chassis {}, Slot {}".format(module_type, mod[0], mod[1]))
 
         name = "{}_chassis{}_slot{}".format(module_type, mod[0], mod[1])
         dictionary.update({name: [mod[0], mod[1]]})
+
+    return dictionary
+
+
+MAX_SLOTS_PER_CHASSIS = 18
+
+
+def detect_chassis():
+    # Returns the sorted list of chassis numbers that hold at least one module, from the driver's module enumeration
+    temp_mod = keysightSD1.SD_AOU()
+    try:
+        module_count = temp_mod.moduleCount()
+        chassis_list = set()
+        for index in range(0, module_count if isinstance(module_count, int) else 0):
+            chassis = temp_mod.getChassisByIndex(index)
+            if isinstance(chassis, int) and chassis >= 0:
+                chassis_list.add(chassis)
+    finally:
         temp_mod.close()
+    return sorted(chassis_list)
+
+
+def _probe_slot(chassis, slot):
+    # Product name of the module in [chassis, slot], or None for an empty slot (getProductNameBySlot returns an error code)
+    temp_mod = keysightSD1.SD_AOU()
+    try:
+        module_type = temp_mod.getProductNameBySlot(chassis, slot)
+    finally:
+        temp_mod.close() # one temporary object per probe, released even if the query raises
+    if isinstance(module_type, str) and module_type:
+        return module_type
+    return None
+
+
+def discover_modules(chassis_list=None, slots=range(1, MAX_SLOTS_PER_CHASSIS + 1), exclude=(), max_workers=32, slot_timeout=0.5):
+    # Probes every slot of every chassis concurrently and returns the same {name: [chassis, slot]} dictionary as
+    # create_module_inventory, ordered by chassis and slot. Only SD1 digitizers (M31xx) and AWGs (M32xx) are returned,
+    # since those are the only types Test.__init__ knows how to open.
+    #   chassis_list:  chassis to probe, defaults to every chassis reported by the driver (detect_chassis)
+    #   exclude:       [chassis, slot] locations to leave out, e.g. the external trigger module
+    #   slot_timeout:  time budget per slot; probes still pending once the budget for the whole batch is spent are
+    #                  treated as empty slots instead of holding up the bench
+
+    if chassis_list is None:
+        chassis_list = detect_chassis()
+    excluded = set((mod[0], mod[1]) for mod in exclude)
+    locations = [(chassis, slot) for chassis in chassis_list for slot in slots if (chassis, slot) not in excluded]
+    if not locations:
+        return {}
+
+    workers = max(1, min(max_workers, len(locations)))
+    pool = ThreadPoolExecutor(max_workers=workers)
+    futures = [pool.submit(_probe_slot, chassis, slot) for chassis, slot in locations]
+    done, not_done = wait(futures, timeout=slot_timeout * math.ceil(len(locations) / workers))
+    pool.shutdown(wait=False, cancel_futures=True) # don't wait for probes that timed out, and drop the ones not started
+
+    dictionary = {}
+    for (chassis, slot), future in zip(locations, futures):
+        if future not in done:
+            print("[ERROR] test_initialization.discover_modules: Probe of Chassis {}, Slot {} timed out".format(chassis, slot))
+            continue
+        if future.exception() is not None:
+            print("[ERROR] test_initialization.discover_modules: Probe of Chassis {}, Slot {} failed: {}".format(chassis, slot, future.exception()))
+            continue
+        module_type = future.result()
+        if module_type is None or len(module_type) < 3 or module_type[2] not in ('1', '2'):
+            continue
+
+        print("Found {} in Chassis {}, Slot {}".format(module_type, chassis, slot))
+
+        name = "{}_chassis{}_slot{}".format(module_type, chassis, slot)
+        dictionary.update({name: [chassis, slot]})
 
     return dictionary
+
+
+def _open_module(key, value):
+    # Opens a single module from its module_dict entry. Returns the module_instances entry and the openWithSlot code
+    if key[2] == '1':
+        sd1_obj = keysightSD1.SD_AIN()
+    elif key[2] == '2':
+        sd1_obj = keysightSD1.SD_AOU()
+    else:
+        print("[ERROR] test_initialization._open_module: Did not properly parse instrument type string for {}.".format(key))
+        return None, None
+    with tracer.span("open_module", cat="module", module=key, chassis=value[0], slot=value[1]) as span:
+        sd1_obj_id = sd1_obj.openWithSlot("", value[0], value[1])
+        span.set(code=sd1_obj_id)
+    return [sd1_obj, key, value], sd1_obj_id
+
+
+def open_modules(module_dict, concurrent=True, max_workers=8):
+    # Opens every module in module_dict. Returns (module_instances, open_errors, elapsed seconds)
+    #   module_instances keeps the module_dict order no matter which open finishes first
+    #   open_errors is {MODULE NAME: ERROR CODE} for each module whose openWithSlot returned a negative code
+
+    items = list(module_dict.items())
+    start = time.perf_counter()
+    if concurrent and len(items) > 1:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+            results = list(pool.map(lambda item: _open_module(*item), items)) # map() returns results in input order
+    else:
+        results = [_open_module(key, value) for key, value in items]
+    elapsed = time.perf_counter() - start
+
+    module_instances = []
+    open_errors = {}
+    for (key, value), (module_inst, code) in zip(items, results):
+        if module_inst is None:
+            continue
+        if code < 0:
+            open_errors[key] = code
+        module_instances.append(module_inst)
+
+    return module_instances, open_errors, elapsed
+
+
+def compare_module_open(module_dict, max_workers=8):
+    # Opens (and closes) the modules once serially and once on the thread pool, and reports the wall-clock speedup
+
+    timings = {}
+    for label, concurrent in (("serial", False), ("concurrent", True)):
+        module_instances, open_errors, elapsed = open_modules(module_dict, concurrent, max_workers)
+        for module_inst in module_instances:
+            module_inst[0].close()
+        timings[label] = elapsed
+        for key, code in open_errors.items():
+            print("[ERROR] test_initialization.compare_module_open: {} open of {} returned {}".format(label, key, code))
+
+    speedup = timings["serial"] / timings["concurrent"] if timings["concurrent"] > 0 else float("inf")
+    print("Opened {} modules: serial {:.3f} s, concurrent {:.3f} s ({} workers), speedup {:.2f}x".format(
+        len(module_dict), timings["serial"], timings["concurrent"], max_workers, speedup))
+    timings["speedup"] = speedup
+    return timings
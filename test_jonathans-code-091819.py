@@ -2,6 +2,8 @@ import sys
 
 sys.path.append('C:\Program Files (x86)\Keysight\SD1\Libraries\Python')
 import keysightSD1 as KSAPI
+from awg_queue import QueuePlan, submit_queue
+from waveform_stream import WaveformSource, stream_upload, stream_queue_plan
 
 if __name__ == '__main__':
 
@@ -23,12 +25,18 @@ if __name__ == '__main__':
 
     high = [1] * 500
     low = [0] * 500
-    data = low + (high * 2) + low
-    data = data * PULSE_COUNT
-
-    wv = KSAPI.SD_Wave()
-    err = wv.newFromArrayDouble(0, data)
-    err = sl.waveformLoad(wv, 0)
-    for _ in range(1000):
-        err = sl.AWGqueueWaveform(CHANNEL, 0, KSAPI.SD_TriggerModes.EXTTRIG, 0, 1, 2)
+    # (low + high * 2 + low) * PULSE_COUNT, uploaded in chunks (waveform numbers 0, 1, ...) instead of as one list
+    source = WaveformSource.pulse_train(low, high * 2, low, count=PULSE_COUNT)
+    result = stream_upload(sl, source, 0)
+    print(result)
+    # The issue is reproduced with one waveform queued 1000 times; a waveform split into several chunks would change
+    # the queue depth and what each trigger plays
+    if len(result.waveform_numbers) != 1:
+        print("[ERROR] The pulse train was uploaded as {} chunks, expected exactly 1".format(len(result.waveform_numbers)))
+        sys.exit()
+    plan = QueuePlan().extend(stream_queue_plan(result.waveform_numbers, KSAPI.SD_TriggerModes.EXTTRIG, 0, 2), count=1000)
+    queue_result = submit_queue(sl, CHANNEL, plan)
+    print(queue_result)
+    for index, error in queue_result.failures:
+        print("[ERROR] AWGqueueWaveform entry {}: {}".format(index, error))
     sl.AWGstart(CHANNEL)
@@ -1,5 +1,7 @@
 import keysightSD1
-import time
+from awg_queue import QueuePlan, submit_queue
+from trigger_scheduler import TriggerScheduler
+from waveform_file import sd_wave_from_file
 
 num_waveforms = 1000
 num_trigs = 1000
@@ -10,18 +12,22 @@ awg_id = awg.openWithSlot("", 1, 7)
 # error_flush = awg.AWGflush(1)
 error_waveshape = awg.channelWaveShape(1, keysightSD1.SD_Waveshapes.AOU_AWG)
 
-wave = keysightSD1.SD_Wave()
-error_createwave = wave.newFromFile(r"C:\Users\Administrator\PycharmProjects\HVITestBench\Sin_10MHz_20456_samples.csv")
+# The CSV is converted to a memory-mapped .hvw file on first use and reused while the CSV is unchanged
+wave, error_createwave = sd_wave_from_file(r"C:\Users\Administrator\PycharmProjects\HVITestBench\Sin_10MHz_20456_samples.csv")
 # error_createwave = wave.newFromFile(r'C:\Users\Public\Documents\Keysight\SD1\Examples\Waveforms\Sin_10MHz_50samples_192cycles.csv')
 error_waveformload = awg.waveformLoad(wave, 1, 0)
 
 error_queueconfig = awg.AWGqueueConfig(1, keysightSD1.SD_QueueMode.CYCLIC)
 
-for i in range(0,num_waveforms):
-    error_queue = awg.AWGqueueWaveform(1, 1, keysightSD1.SD_TriggerModes.SWHVITRIG_CYCLE, 0, 1, 0)
-    # awg.AWGqueueWaveform(nAWG, waveformNumber=, triggerMode=, startDelay=,cycles=,prescaler=)
+# QueuePlan.add(waveformNumber, triggerMode, startDelay, cycles, prescaler, count)
+plan = QueuePlan().add(1, keysightSD1.SD_TriggerModes.SWHVITRIG_CYCLE, 0, 1, 0, count=num_waveforms)
+queue_result = submit_queue(awg, 1, plan)
+print(queue_result)
+for index, error in queue_result.failures:
+    print("[ERROR] AWGqueueWaveform entry {}: {}".format(index, error))
 
-for i in range(0,num_trigs):
-    print("Sending %s trigger"%i)
-    error_trigger = awg.AWGtrigger(1)
-    time.sleep(.3)
+# One trigger every 0.3 s on a fixed grid (sleep + spin, see trigger_scheduler.py) instead of sleep(.3) after each one
+trigger_result = TriggerScheduler(period=.3, count=num_trigs).run(lambda i: awg.AWGtrigger(1))
+print(trigger_result)
+for index, error in trigger_result.failures:
+    print("[ERROR] AWGtrigger %s: %s" % (index, error))
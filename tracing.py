@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+import time
+
+# Timing spans for the Test lifecycle, exported as a Chrome trace.
+#
+# The bench code wraps each phase (module open, configure_hardware, configure_hvi, compile, load_to_hw, run,
+# release_hw, close) in a span of the session tracer:
+#
+#   with tracer.span("load_to_hw", test=self.test_key):
+#       self.hvi.load_to_hw()
+#
+# Spans opened inside another span on the same thread nest under it; the per-module and per-engine steps (opening each
+# module, configuring each module, defining each engine) are spans of their own, with the module or engine in their
+# arguments. The tracer is disabled by default and span() then returns a shared do-nothing span, so the instrumented
+# code pays one attribute check per phase. To record a run:
+#
+#   tracer.enable()
+#   ...                               # run the tests
+#   tracer.export("bench_trace.json") # open in chrome://tracing or https://ui.perfetto.dev
+#   print(tracer.report())
+#
+# or "python test_bench.py --trace bench_trace.json".
+
+
+class _NullSpan:
+    # Returned by Tracer.span() while the tracer is disabled
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+
+    __slots__ = ("tracer", "name", "cat", "args", "start")
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = None
+
+    def set(self, **args):
+        # Adds arguments to the span while it is open, e.g. the outcome of the phase
+        self.args.update(args)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.args["error"] = "{}: {}".format(exc_type.__name__, exc)
+        self.tracer._record(self.name, self.cat, self.start, end, self.args)
+        return False
+
+
+class Tracer:
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = [] # FORMAT: [(NAME, CATEGORY, START, END, THREAD ID, ARGS)], perf_counter seconds
+        self.threads = {} # FORMAT: {THREAD ID: THREAD NAME}
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock() # spans are recorded from the module open/config and compile thread pools
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+            self.threads = {}
+            self.origin = time.perf_counter()
+
+    def span(self, name, cat="bench", **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, cat, args)
+
+    def _record(self, name, cat, start, end, args):
+        thread = threading.current_thread()
+        with self._lock:
+            self.spans.append((name, cat, start, end, thread.ident, args))
+            if thread.ident not in self.threads:
+                self.threads[thread.ident] = thread.name
+
+    def summary(self):
+        # {NAME: {"count", "total", "max"}} in seconds
+        summary = {}
+        with self._lock:
+            spans = list(self.spans)
+        for name, cat, start, end, tid, args in spans:
+            entry = summary.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            entry["count"] += 1
+            entry["total"] += end - start
+            entry["max"] = max(entry["max"], end - start)
+        return summary
+
+    def report(self):
+        summary = self.summary()
+        if not summary:
+            return "Trace: no spans recorded"
+        lines = ["Trace: {} spans".format(sum(entry["count"] for entry in summary.values()))]
+        for name in sorted(summary, key=lambda name: summary[name]["total"], reverse=True):
+            entry = summary[name]
+            lines.append("  {:<24} {:>6} x {:>10.3f} s total {:>10.3f} s max".format(name, entry["count"], entry["total"], entry["max"]))
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        # Trace Event Format: one complete ("X") event per span, timestamps in microseconds from the tracer origin
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+            threads = dict(self.threads)
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                  for tid, name in threads.items()]
+        for name, cat, start, end, tid, args in spans:
+            events.append({"name": name, "cat": cat, "ph": "X", "pid": pid, "tid": tid,
+                           "ts": 1e6 * (start - self.origin), "dur": 1e6 * (end - start),
+                           "args": {key: value if isinstance(value, (int, float, str, bool)) or value is None else str(value)
+                                    for key, value in args.items()}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+# Tracer shared by the whole session
+tracer = Tracer()
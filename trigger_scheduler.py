@@ -0,0 +1,163 @@
+import ctypes
+import os
+import threading
+import time
+
+# Host-timed trigger pacing.
+#
+# Pacing triggers with time.sleep() between them accumulates drift (every iteration adds the trigger call's own
+# duration) and inherits the OS sleep granularity, which is a millisecond or worse. TriggerScheduler fires a callable
+# on a fixed grid of deadlines measured with time.perf_counter() from the start of the run: it sleeps until shortly
+# before each deadline and spins for the rest, so the lateness of one trigger does not shift the following ones.
+#
+#   scheduler = TriggerScheduler(period=0.3, count=1000)
+#   result = scheduler.run(lambda index: awg.AWGtrigger(1))
+#   print(result)
+#
+# start() runs the same loop on a worker thread, optionally pinned to one CPU (os.sched_setaffinity on Linux,
+# SetThreadAffinityMask on Windows; elsewhere the thread is not pinned) and join() returns the result, or raises the
+# exception the callable raised. The callable's return value is treated as a driver error code: negative values are
+# recorded as failures by trigger index.
+#
+# A trigger's timestamp is taken just before the callable runs. A callable that does other work before the trigger
+# write (e.g. the WfNum broadcast of fast branching) returns (error code, time.perf_counter() at the trigger write)
+# instead, so timestamps and jitter refer to the trigger itself. Fired back to back (period 0) there is no deadline
+# grid, so no jitter is reported.
+
+DEFAULT_SPIN_THRESHOLD = 0.002 # seconds before a deadline at which sleeping stops and spinning starts
+JITTER_BINS = [1e-6, 2e-6, 5e-6, 1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2] # histogram upper edges, s
+
+
+def wait_until(deadline, spin_threshold=DEFAULT_SPIN_THRESHOLD):
+    # Returns once time.perf_counter() >= deadline: sleeps while the deadline is far away, then busy-waits. The spin
+    # yields the GIL (sleep(0)) on every pass, so threads such as a RegisterPoller keep running while it waits
+    remaining = deadline - time.perf_counter()
+    if remaining > spin_threshold:
+        time.sleep(remaining - spin_threshold)
+    while time.perf_counter() < deadline:
+        time.sleep(0)
+
+
+class ScheduleResult:
+
+    def __init__(self, period):
+        self.period = period
+        self.scheduled = [] # deadline of each trigger, perf_counter seconds
+        self.timestamps = [] # time each trigger was actually issued, perf_counter seconds
+        self.failures = [] # FORMAT: [(TRIGGER INDEX, ERROR CODE)]
+        self.seconds = 0.0
+
+    @property
+    def jitter(self):
+        # Lateness of each trigger relative to its deadline, seconds (none without a deadline grid)
+        if not self.period:
+            return []
+        return [actual - deadline for actual, deadline in zip(self.timestamps, self.scheduled)]
+
+    @property
+    def rate(self):
+        # Achieved triggers/s between the first and the last trigger
+        if len(self.timestamps) < 2:
+            return 0.0
+        return (len(self.timestamps) - 1) / (self.timestamps[-1] - self.timestamps[0])
+
+    def histogram(self, bins=JITTER_BINS):
+        # Returns [(upper edge or None for the overflow bin, count)]
+        counts = [0] * (len(bins) + 1)
+        for value in self.jitter:
+            index = 0
+            while index < len(bins) and value > bins[index]:
+                index += 1
+            counts[index] += 1
+        return list(zip(list(bins) + [None], counts))
+
+    def __str__(self):
+        jitter = sorted(self.jitter)
+        lines = ["Issued {} triggers in {:.3f} s, period {:.6f} s ({:.1f} triggers/s achieved), {} failures".format(
+            len(self.timestamps), self.seconds, self.period, self.rate, len(self.failures))]
+        if not self.period:
+            lines.append("Jitter: not measured, the triggers were fired back to back without a deadline grid")
+        elif jitter:
+            lines.append("Jitter: median {:.1f} us, p99 {:.1f} us, max {:.1f} us".format(
+                1e6 * jitter[len(jitter) // 2], 1e6 * jitter[min(len(jitter) - 1, int(len(jitter) * 0.99))], 1e6 * jitter[-1]))
+            for edge, count in self.histogram():
+                if count:
+                    label = "<= {:g} us".format(edge * 1e6) if edge is not None else "> {:g} us".format(JITTER_BINS[-1] * 1e6)
+                    lines.append("  {:>14} {:>8} {}".format(label, count, "#" * max(1, round(50 * count / len(jitter)))))
+        return "\n".join(lines)
+
+
+class TriggerScheduler:
+
+    def __init__(self, period, count, spin_threshold=DEFAULT_SPIN_THRESHOLD, cpu=None):
+        # period: seconds between trigger deadlines, 0 to fire back to back
+        # cpu:    CPU index the worker thread of start() is pinned to, None to leave it unpinned
+        if period < 0 or count < 0:
+            raise ValueError("period and count must not be negative")
+        self.period = period
+        self.count = count
+        self.spin_threshold = spin_threshold
+        self.cpu = cpu
+        self._thread = None
+        self._result = None
+        self._error = None # exception raised on the worker thread, re-raised by join()
+
+    def run(self, fire):
+        # Calls fire(index) for index 0 .. count - 1 on the calling thread, one per period. Returns a ScheduleResult
+        result = ScheduleResult(self.period)
+        perf_counter = time.perf_counter
+
+        start = perf_counter()
+        for index in range(0, self.count):
+            if self.period:
+                deadline = start + index * self.period
+                wait_until(deadline, self.spin_threshold)
+            else:
+                deadline = perf_counter() # back to back: no grid, every trigger is due as soon as the last one returned
+            issued = perf_counter()
+            error = fire(index)
+            if isinstance(error, tuple):
+                error, issued = error
+            result.scheduled.append(deadline)
+            result.timestamps.append(issued)
+            if isinstance(error, int) and error < 0:
+                result.failures.append((index, error))
+        result.seconds = perf_counter() - start
+
+        return result
+
+    def _pin(self):
+        # Pins the calling thread to self.cpu
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, {self.cpu})
+        elif os.name == "nt":
+            kernel32 = ctypes.windll.kernel32
+            kernel32.GetCurrentThread.restype = ctypes.c_void_p
+            kernel32.SetThreadAffinityMask.restype = ctypes.c_size_t
+            kernel32.SetThreadAffinityMask.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+            if not kernel32.SetThreadAffinityMask(kernel32.GetCurrentThread(), 1 << self.cpu):
+                print("[ERROR] trigger_scheduler.TriggerScheduler: SetThreadAffinityMask failed for CPU {} (error {}), running "
+                      "unpinned".format(self.cpu, ctypes.GetLastError()))
+        else:
+            print("[ERROR] trigger_scheduler.TriggerScheduler: CPU pinning is not supported on this platform, running unpinned")
+
+    def _worker(self, fire):
+        try:
+            if self.cpu is not None:
+                self._pin()
+            self._result = self.run(fire)
+        except BaseException as ex:
+            self._error = ex
+
+    def start(self, fire):
+        # Runs the schedule on a worker thread (pinned to self.cpu if set). Call join() for the result
+        self._thread = threading.Thread(target=self._worker, args=(fire,), daemon=True)
+        self._result = None
+        self._error = None
+        self._thread.start()
+
+    def join(self):
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._result
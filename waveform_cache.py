@@ -0,0 +1,125 @@
+import hashlib
+import threading
+import time
+
+# Content-addressed record of the waveforms resident in each module's AWG memory.
+#
+# The fast branching hardware configurator used to flush the AWG memory and upload every waveform on every run, even
+# when the very same waveforms were already loaded. WaveformResidency remembers, per module object and waveform number,
+# the digest and size of the content that was last uploaded:
+#   - a module that is not in the table yet has unknown memory content: flush it once, then upload
+#   - a waveform number that already holds the same digest is skipped
+#   - a waveform number that holds different content no larger than the resident one is replaced with waveformReLoad,
+#     without flushing the others
+#   - a larger replacement, or one whose waveformReLoad failed, cannot reuse the resident waveform's memory: the module is
+#     flushed and the waveform loaded with waveformLoad. Its other waveforms are gone then; generation(module) changes
+#     on every flush so the caller can tell and load them again (see WaveformTable.load)
+# The table is keyed by the module object, so a module that is closed and reopened starts over with a flush. Anything
+# that flushes the AWG memory behind the table's back must call invalidate(module).
+
+
+def waveform_digest(data):
+    # Digest of a sample array (numpy array or sequence of floats), covering dtype, shape and content
+    if hasattr(data, "tobytes"):
+        payload = "{}{}".format(data.dtype, data.shape).encode("utf-8") + data.tobytes()
+    else:
+        payload = repr(list(data)).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class WaveformResidency:
+
+    def __init__(self):
+        self.resident = {} # FORMAT: {MODULE OBJECT: {WAVEFORM NUMBER: (DIGEST, BYTES OF MEMORY)}}
+        self.flushes = {} # FORMAT: {MODULE OBJECT: NUMBER OF FLUSHES}
+        self.uploads = 0
+        self.skipped = 0
+        self.bytes_uploaded = 0
+        self.bytes_saved = 0
+        self.upload_time = 0.0
+        self.seconds_saved = 0.0 # estimated from the measured upload rate
+        self._lock = threading.Lock()
+
+    def is_tracked(self, module):
+        return module in self.resident
+
+    def flush(self, module):
+        # Flushes the module's AWG memory and starts tracking it with an empty table
+        error = module.waveformFlush()
+        with self._lock:
+            self.resident[module] = {}
+            self.flushes[module] = self.flushes.get(module, 0) + 1
+        return error
+
+    def generation(self, module):
+        # Changes every time the module's AWG memory is flushed
+        with self._lock:
+            return self.flushes.get(module, 0)
+
+    def invalidate(self, module):
+        # Forgets the module's memory content, so its next load starts with a flush
+        with self._lock:
+            self.resident.pop(module, None)
+
+    def load(self, module, wave, wfmNum, digest, nbytes):
+        # Makes sure waveform wfmNum of module holds the content identified by digest. Returns the driver error code
+        # (0 when the upload was skipped)
+        if module not in self.resident:
+            error = self.flush(module)
+            if isinstance(error, int) and error < 0:
+                return error
+        table = self.resident[module]
+        resident = table.get(wfmNum)
+
+        if resident is not None and resident[0] == digest:
+            with self._lock:
+                self.skipped += 1
+                self.bytes_saved += nbytes
+                if self.bytes_uploaded > 0:
+                    self.seconds_saved += nbytes * self.upload_time / self.bytes_uploaded
+            return 0
+
+        start = time.perf_counter()
+        capacity = nbytes # memory the waveform number holds: a ReLoad keeps the size of the waveform it replaces
+        if resident is None:
+            error = module.waveformLoad(wave, wfmNum)
+        else:
+            error = module.waveformReLoad(wave, wfmNum, 0) if nbytes <= resident[1] else None
+            if error is not None and not (isinstance(error, int) and error < 0):
+                capacity = resident[1]
+            else:
+                # The number stays taken until the memory is flushed, so waveformLoad needs an empty AWG memory
+                error = self.flush(module)
+                if isinstance(error, int) and error < 0:
+                    self.invalidate(module)
+                    return error
+                table = self.resident[module]
+                error = module.waveformLoad(wave, wfmNum)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            if isinstance(error, int) and error < 0:
+                table.pop(wfmNum, None)
+            else:
+                table[wfmNum] = (digest, capacity)
+                self.uploads += 1
+                self.bytes_uploaded += nbytes
+                self.upload_time += elapsed
+        return error
+
+    def snapshot(self):
+        with self._lock:
+            return {"uploads": self.uploads, "skipped": self.skipped, "bytes_uploaded": self.bytes_uploaded,
+                    "bytes_saved": self.bytes_saved, "upload_time": self.upload_time, "seconds_saved": self.seconds_saved}
+
+    def report(self, since=None):
+        # Summary of everything since the given snapshot (or since the start of the session)
+        now = self.snapshot()
+        if since is not None:
+            now = {key: now[key] - since[key] for key in now}
+        return "Waveforms: {} uploaded ({} bytes, {:.3f} s), {} already resident ({} bytes, ~{:.3f} s saved)".format(
+            now["uploads"], now["bytes_uploaded"], now["upload_time"], now["skipped"], now["bytes_saved"], now["seconds_saved"])
+
+
+# Residency table shared by the hardware configurators for the whole session
+waveform_residency = WaveformResidency()
@@ -0,0 +1,230 @@
+import sys
+sys.path.append('C:/Program Files (x86)/Keysight/SD1/Libraries/Python')
+import argparse
+import glob
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import keysightSD1
+import numpy
+
+# Binary, memory-mappable waveform files (.hvw) and a cached import of SD1 waveform CSV files.
+#
+# SD_Wave.newFromFile parses the text CSV on every run, which gets slow for multi-megasample waveforms. Instead, a CSV
+# is converted once into an .hvw file and memory-mapped on later runs:
+#
+#   offset 0   b"HVIW"
+#   offset 4   uint32 (little-endian) length of the JSON header
+#   offset 8   JSON header: version, channels, samples, waveform_type, data_offset and the source CSV's path, size and
+#              mtime (nanoseconds)
+#   data_offset (64-byte aligned)
+#              float64 little-endian samples, one contiguous block per channel (channel A, then channel B)
+#
+# load_waveform(path) reuses the converted file as long as the CSV's path, size and mtime are unchanged, and converts it
+# again otherwise. A new conversion goes to a new file name (the name includes the CSV's size and mtime): an earlier
+# load may still have the old file memory-mapped, and Windows refuses to replace or delete a mapped file. Stale
+# conversions are deleted once nothing maps them any more. sd_wave_from_file(path) is the drop-in replacement for
+# SD_Wave().newFromFile(path).
+#
+# The CSV reader accepts the SD1 layout: optional "key,value" header rows (waveformName, waveformPoints, waveformType,
+# ...) followed by one row per sample with one value, or two for dual/IQ waveforms.
+#
+#   python waveform_file.py Gaussian.csv Sin_10MHz_20456_samples.csv     (convert ahead of time)
+
+MAGIC = b"HVIW"
+FORMAT_VERSION = 1
+DATA_ALIGNMENT = 64
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "converted_waveforms")
+
+_convert_lock = threading.Lock()
+
+
+def read_csv_waveform(csv_path):
+    # Parses an SD1 waveform CSV. Returns (samples array with shape (channels, samples), header dict)
+    header = {}
+    columns = None
+    with open(csv_path, "r") as f:
+        for line in f:
+            fields = [field.strip() for field in line.strip().split(",") if field.strip() != ""]
+            if not fields:
+                continue
+            try:
+                values = [float(field) for field in fields]
+            except ValueError:
+                if columns is None and len(fields) >= 2:
+                    header[fields[0]] = fields[1]
+                    continue
+                raise ValueError("{}: cannot parse line {!r}".format(csv_path, line.strip()))
+            if columns is None:
+                columns = [[] for _ in values]
+            if len(values) != len(columns):
+                raise ValueError("{}: expected {} values per line, got {!r}".format(csv_path, len(columns), line.strip()))
+            for column, value in zip(columns, values):
+                column.append(value)
+    if not columns:
+        raise ValueError("{}: no samples found".format(csv_path))
+    return numpy.array(columns, dtype="<f8"), header
+
+
+def write_waveform(path, data, waveform_type=None, source=None):
+    # Writes data (1-D, or (channels, samples)) to an .hvw file. source is the os.stat of the CSV it came from
+    data = numpy.atleast_2d(numpy.asarray(data, dtype="<f8"))
+    header = {"version": FORMAT_VERSION,
+              "channels": int(data.shape[0]),
+              "samples": int(data.shape[1]),
+              "waveform_type": waveform_type,
+              "source": None,
+              "source_size": None,
+              "source_mtime_ns": None,
+              "data_offset": 0}
+    if source is not None:
+        header.update(source=source[0], source_size=source[1].st_size, source_mtime_ns=source[1].st_mtime_ns)
+
+    # The header's own length depends on data_offset, so fix the offset with a padded header
+    encoded = json.dumps(header).encode("utf-8")
+    header["data_offset"] = (8 + len(encoded) + 32 + DATA_ALIGNMENT - 1) // DATA_ALIGNMENT * DATA_ALIGNMENT
+    encoded = json.dumps(header).encode("utf-8")
+    encoded += b" " * (header["data_offset"] - 8 - len(encoded))
+
+    # Write next to the destination and rename, so a reader never maps a half-written file
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC + struct.pack("<I", len(encoded)) + encoded)
+            f.write(numpy.ascontiguousarray(data).tobytes())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def read_waveform_header(path):
+    with open(path, "rb") as f:
+        prefix = f.read(8)
+        if len(prefix) != 8 or prefix[:4] != MAGIC:
+            raise ValueError("{} is not an .hvw waveform file".format(path))
+        header = json.loads(f.read(struct.unpack("<I", prefix[4:])[0]).decode("utf-8"))
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError("{} has unsupported version {}".format(path, header.get("version")))
+    return header
+
+
+def open_waveform(path):
+    # Memory-maps an .hvw file. Returns (read-only array with shape (channels, samples), header dict)
+    header = read_waveform_header(path)
+    data = numpy.memmap(path, dtype="<f8", mode="r", offset=header["data_offset"], shape=(header["channels"], header["samples"]))
+    return data, header
+
+
+def _converted_prefix(csv_path, cache_dir=DEFAULT_CACHE_DIR):
+    # Common start of the cache file names of a CSV: its base name plus a hash of its absolute path, so equal names in
+    # different directories do not collide
+    csv_path = os.path.abspath(csv_path)
+    digest = hashlib.sha1(csv_path.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cache_dir, "{}-{}".format(os.path.splitext(os.path.basename(csv_path))[0], digest))
+
+
+def converted_path(csv_path, cache_dir=DEFAULT_CACHE_DIR):
+    # Cache file name for the current content of a CSV: the prefix plus a hash of the CSV's size and mtime
+    source_stat = os.stat(csv_path)
+    version = hashlib.sha1("{},{}".format(source_stat.st_size, source_stat.st_mtime_ns).encode("utf-8")).hexdigest()[:8]
+    return "{}-{}.hvw".format(_converted_prefix(csv_path, cache_dir), version)
+
+
+def _remove_stale_conversions(csv_path, hvw_path, cache_dir=DEFAULT_CACHE_DIR):
+    # Deletes the older conversions of a CSV. One that is still memory-mapped (Windows) is left for a later call
+    for stale_path in glob.glob(glob.escape(_converted_prefix(csv_path, cache_dir)) + "-*.hvw"):
+        if os.path.normcase(os.path.abspath(stale_path)) == os.path.normcase(os.path.abspath(hvw_path)):
+            continue
+        try:
+            os.remove(stale_path)
+        except OSError:
+            pass
+
+
+def convert_csv(csv_path, hvw_path=None, cache_dir=DEFAULT_CACHE_DIR):
+    # One-time conversion of a CSV waveform into an .hvw file. Returns the .hvw path
+    csv_path = os.path.abspath(csv_path)
+    if hvw_path is None:
+        hvw_path = converted_path(csv_path, cache_dir)
+    os.makedirs(os.path.dirname(os.path.abspath(hvw_path)), exist_ok=True)
+    source_stat = os.stat(csv_path)
+    data, header = read_csv_waveform(csv_path)
+    write_waveform(hvw_path, data, header.get("waveformType"), (csv_path, source_stat))
+    return hvw_path
+
+
+def _is_current(hvw_path, csv_path):
+    try:
+        header = read_waveform_header(hvw_path)
+        source_stat = os.stat(csv_path)
+    except (OSError, ValueError):
+        return False
+    return (header["source"] == csv_path and header["source_size"] == source_stat.st_size
+            and header["source_mtime_ns"] == source_stat.st_mtime_ns)
+
+
+def load_waveform(path, cache_dir=DEFAULT_CACHE_DIR):
+    # Returns (array with shape (channels, samples), header) for an .hvw file or a CSV. A CSV is converted on first use
+    # and whenever it changed since; otherwise its converted file is memory-mapped without parsing anything
+    if not path.lower().endswith(".csv"):
+        return open_waveform(path)
+
+    csv_path = os.path.abspath(path)
+    hvw_path = converted_path(csv_path, cache_dir)
+    if not _is_current(hvw_path, csv_path):
+        with _convert_lock:
+            if not _is_current(hvw_path, csv_path):
+                convert_csv(csv_path, hvw_path)
+                _remove_stale_conversions(csv_path, hvw_path, cache_dir)
+    return open_waveform(hvw_path)
+
+
+def _sd1_waveform_type(name, channels):
+    # Maps a waveformType header value (e.g. "WAVE_ANALOG_16") onto keysightSD1.SD_WaveformTypes
+    types = keysightSD1.SD_WaveformTypes
+    if name:
+        for candidate in ("WAVE_IQPOLAR", "WAVE_IQ", "WAVE_ANALOG_DUAL", "WAVE_DIGITAL", "WAVE_ANALOG"):
+            if name.upper().startswith(candidate) and hasattr(types, candidate):
+                return getattr(types, candidate)
+    return types.WAVE_ANALOG_DUAL if channels == 2 else types.WAVE_ANALOG
+
+
+def sd_wave_from_file(path, cache_dir=DEFAULT_CACHE_DIR):
+    # Replacement for SD_Wave().newFromFile(path) that goes through load_waveform. Returns (SD_Wave, error code)
+    try:
+        data, header = load_waveform(path, cache_dir)
+    except (OSError, ValueError) as ex:
+        print("[ERROR] waveform_file.sd_wave_from_file: {}".format(ex))
+        return keysightSD1.SD_Wave(), -1
+    return sd_wave_from_array(data, header)
+
+
+def sd_wave_from_array(data, header):
+    # SD_Wave from the (data, header) pair load_waveform returned. Returns (SD_Wave, error code)
+    wave = keysightSD1.SD_Wave()
+    waveform_type = _sd1_waveform_type(header["waveform_type"], header["channels"])
+    if header["channels"] == 1:
+        error = wave.newFromArrayDouble(waveform_type, data[0])
+    else:
+        error = wave.newFromArrayDouble(waveform_type, data[0], data[1])
+    return wave, error
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert SD1 waveform CSV files to memory-mappable .hvw files")
+    parser.add_argument('csv_files', nargs='+', help='CSV waveform files to convert')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Directory for the converted files')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    for csv_file in args.csv_files:
+        hvw_path = convert_csv(csv_file, cache_dir=args.cache_dir)
+        header = read_waveform_header(hvw_path)
+        print("{} -> {} ({} samples, {} channel(s))".format(csv_file, hvw_path, header["samples"], header["channels"]))
@@ -0,0 +1,167 @@
+import sys
+sys.path.append('C:/Program Files (x86)/Keysight/SD1/Libraries/Python')
+import time
+import keysightSD1
+import numpy
+from awg_queue import QueuePlan, submit_queue
+from waveform_file import load_waveform
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Chunked streaming upload of very large waveforms.
+#
+# Building a whole waveform as a Python list (e.g. data = (low + high*2 + low) * PULSE_COUNT) and handing it to
+# SD_Wave.newFromArrayDouble needs host memory proportional to the waveform length, several times over. Here a
+# WaveformSource produces the samples in fixed-size float64 chunks (from a generator or a memory-mapped .hvw/CSV file)
+# and stream_upload() loads every chunk into the AWG as its own waveform number, so only one chunk is ever held on the
+# host. The AWG plays the chunks back to back when they are queued in order, the first one with the wanted trigger mode
+# and the others with AUTOTRIG (see stream_queue_plan).
+#
+#   source = WaveformSource.pulse_train([0.0] * 500, [1.0] * 1000, [0.0] * 500, count=100000)
+#   result = stream_upload(module, source, first_wfm_num=0)
+#   queue_stream(module, nAWG, result.waveform_numbers, keysightSD1.SD_TriggerModes.EXTTRIG)
+#
+# The AWG pads each waveform with zeros to a multiple of 10 samples, so every chunk except the last must be a multiple
+# of 10 samples long for the playback to be seamless.
+
+CHUNK_ALIGNMENT = 10
+DEFAULT_CHUNK_SAMPLES = 1000000
+
+
+def current_rss():
+    # Resident set size of this process in bytes, or None if it cannot be measured. With psutil this is the current RSS;
+    # without it, the peak RSS reported by the resource module (Unix only)
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class WaveformSource:
+
+    def __init__(self, chunk_iterator, total_samples=None, chunk_samples=DEFAULT_CHUNK_SAMPLES):
+        # chunk_iterator: callable returning an iterator of float64 arrays of chunk_samples samples (the last may be shorter)
+        if chunk_samples <= 0 or chunk_samples % CHUNK_ALIGNMENT != 0:
+            raise ValueError("chunk_samples must be a positive multiple of {}".format(CHUNK_ALIGNMENT))
+        self.chunk_iterator = chunk_iterator
+        self.total_samples = total_samples
+        self.chunk_samples = chunk_samples
+
+    def chunks(self):
+        return self.chunk_iterator()
+
+    @classmethod
+    def from_pieces(cls, pieces, total_samples=None, chunk_samples=DEFAULT_CHUNK_SAMPLES):
+        # pieces: callable returning an iterable of sample arrays/lists of any size; they are re-cut into fixed-size chunks
+        # through a single preallocated buffer, so each chunk is only valid until the next one is requested
+        def chunk_iterator():
+            buffer = numpy.empty(chunk_samples, dtype=numpy.float64)
+            filled = 0
+            for piece in pieces():
+                piece = numpy.asarray(piece, dtype=numpy.float64).ravel()
+                while piece.size:
+                    count = min(chunk_samples - filled, piece.size)
+                    buffer[filled:filled + count] = piece[:count]
+                    filled += count
+                    piece = piece[count:]
+                    if filled == chunk_samples:
+                        yield buffer
+                        filled = 0
+            if filled:
+                yield buffer[:filled]
+        return cls(chunk_iterator, total_samples, chunk_samples)
+
+    @classmethod
+    def from_generator(cls, sample_function, total_samples, chunk_samples=DEFAULT_CHUNK_SAMPLES):
+        # sample_function(indices) -> sample values for a numpy array of sample indices, evaluated one chunk at a time
+        def chunk_iterator():
+            for start in range(0, total_samples, chunk_samples):
+                indices = numpy.arange(start, min(start + chunk_samples, total_samples), dtype=numpy.float64)
+                yield numpy.asarray(sample_function(indices), dtype=numpy.float64)
+        return cls(chunk_iterator, total_samples, chunk_samples)
+
+    @classmethod
+    def from_file(cls, path, channel=0, chunk_samples=DEFAULT_CHUNK_SAMPLES):
+        # Streams one channel of an .hvw file (or a CSV, converted once, see waveform_file.py) straight from the mapping
+        data, header = load_waveform(path)
+        def chunk_iterator():
+            for start in range(0, header["samples"], chunk_samples):
+                yield data[channel, start:start + chunk_samples]
+        return cls(chunk_iterator, header["samples"], chunk_samples)
+
+    @classmethod
+    def pulse_train(cls, *segments, count=1, chunk_samples=DEFAULT_CHUNK_SAMPLES):
+        # The concatenation of segments, repeated count times, without ever building the repeated list
+        pulse = numpy.concatenate([numpy.asarray(segment, dtype=numpy.float64) for segment in segments])
+        return cls.from_pieces(lambda: (pulse for _ in range(count)), pulse.size * count, chunk_samples)
+
+
+class StreamResult:
+
+    def __init__(self):
+        self.waveform_numbers = []
+        self.errors = [] # FORMAT: [(WAVEFORM NUMBER, ERROR CODE)]
+        self.samples = 0
+        self.seconds = 0.0
+        self.peak_rss = None # bytes, see current_rss()
+
+    @property
+    def samples_per_second(self):
+        return self.samples / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        rss = "{:.1f} MB".format(self.peak_rss / 1e6) if self.peak_rss is not None else "n/a"
+        return "Streamed {} samples in {} chunks, {:.3f} s ({:.0f} samples/s), peak RSS {}, {} errors".format(
+            self.samples, len(self.waveform_numbers), self.seconds, self.samples_per_second, rss, len(self.errors))
+
+
+def stream_upload(moduleAOU, source, first_wfm_num, waveform_type=keysightSD1.SD_WaveformTypes.WAVE_ANALOG):
+    # Loads the source chunk by chunk as waveform numbers first_wfm_num, first_wfm_num + 1, ... Returns a StreamResult
+    result = StreamResult()
+    rss = current_rss()
+    result.peak_rss = rss
+
+    start = time.perf_counter()
+    wfmNum = first_wfm_num
+    for chunk in source.chunks():
+        wave = keysightSD1.SD_Wave()
+        error = wave.newFromArrayDouble(waveform_type, numpy.ascontiguousarray(chunk, dtype=numpy.float64))
+        if not (isinstance(error, int) and error < 0):
+            error = moduleAOU.waveformLoad(wave, wfmNum)
+        if isinstance(error, int) and error < 0:
+            result.errors.append((wfmNum, error))
+        result.waveform_numbers.append(wfmNum)
+        result.samples += len(chunk)
+        del wave
+
+        rss = current_rss()
+        if rss is not None and (result.peak_rss is None or rss > result.peak_rss):
+            result.peak_rss = rss
+        wfmNum += 1
+    result.seconds = time.perf_counter() - start
+
+    return result
+
+
+def stream_queue_plan(waveform_numbers, triggerMode, startDelay=0, prescaler=0):
+    # Queue plan that plays the chunks of a streamed waveform back to back, each once: the first one waits for
+    # triggerMode, the rest follow immediately
+    plan = QueuePlan()
+    for index, wfmNum in enumerate(waveform_numbers):
+        if index == 0:
+            plan.add(wfmNum, triggerMode, startDelay, 1, prescaler)
+        else:
+            plan.add(wfmNum, keysightSD1.SD_TriggerModes.AUTOTRIG, 0, 1, prescaler)
+    return plan
+
+
+def queue_stream(moduleAOU, nAWG, waveform_numbers, triggerMode, startDelay=0, prescaler=0):
+    # Queues a streamed waveform once (see stream_queue_plan). Returns the list of (index, error code) that failed
+    return submit_queue(moduleAOU, nAWG, stream_queue_plan(waveform_numbers, triggerMode, startDelay, prescaler)).failures
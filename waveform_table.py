@@ -0,0 +1,116 @@
+import sys
+sys.path.append('C:/Program Files (x86)/Keysight/SD1/Libraries/Python')
+from collections import namedtuple
+import keysightSD1
+import numpy
+from waveform_cache import waveform_digest, waveform_residency
+from waveform_file import load_waveform, sd_wave_from_array
+
+# Table of the waveforms the fast branching test branches between.
+#
+# The fast branching HVI queues, on every engine, the waveform whose number is in the engine's WfNum register. A
+# WaveformTable holds any number of waveforms, entry i being loaded as waveform number first_wfm_num + i. Everything
+# the host needs per selection is prepared when the table is built: the SD_Wave objects, their digests (so
+# waveform_residency uploads each one only once per module), the waveform number of every entry and name, and the
+# number that follows each number in table order. Choosing a waveform is then one WfNum write per engine
+# (test_fastbranching.select_waveform), with no lookups on the way:
+#
+#   table = WaveformTable([pulse, ramp, gaussian], names=["pulse", "ramp", "gaussian"])
+#   table = WaveformTable.from_files(["Gaussian.csv", "Sin_10MHz_20456_samples.csv"])
+#   test_fastbranching.waveform_table = table     # before the test object is created
+#   ...
+#   test.select_waveform(table.number("gaussian"))
+#   test.run_triggers(1000, order=table.numbers_for(["pulse", "gaussian", "gaussian"]))
+
+WaveformEntry = namedtuple("WaveformEntry", ["name", "wfmNum", "wave", "digest", "nbytes"])
+
+
+class WaveformTable:
+
+    def __init__(self, waveforms, names=None, first_wfm_num=1, waveform_type=keysightSD1.SD_WaveformTypes.WAVE_ANALOG):
+        # waveforms: sample arrays (one channel each). names default to "wfm<waveform number>"
+        self.entries = []
+        for index, data in enumerate(waveforms):
+            data = numpy.ascontiguousarray(data, dtype=numpy.float64)
+            wfmNum = first_wfm_num + index
+            wave = keysightSD1.SD_Wave()
+            error = wave.newFromArrayDouble(waveform_type, data)
+            if isinstance(error, int) and error < 0:
+                print("[ERROR] waveform_table.WaveformTable: newFromArrayDouble returned {} for waveform {}".format(error, wfmNum))
+            name = names[index] if names is not None else "wfm{}".format(wfmNum)
+            self.entries.append(WaveformEntry(name, wfmNum, wave, waveform_digest(data), data.nbytes))
+        self._build_index()
+
+    @classmethod
+    def from_files(cls, paths, first_wfm_num=1):
+        # One entry per SD1 CSV or .hvw file (see waveform_file.py), named after the file. A file that cannot be read
+        # is left out and the following files move up, so the waveform numbers stay contiguous
+        table = cls([], first_wfm_num=first_wfm_num)
+        for path in paths:
+            try:
+                data, header = load_waveform(path)
+            except (OSError, ValueError) as ex:
+                print("[ERROR] waveform_table.WaveformTable.from_files: could not read {} ({})".format(path, ex))
+                continue
+            wave, error = sd_wave_from_array(data, header)
+            if isinstance(error, int) and error < 0:
+                print("[ERROR] waveform_table.WaveformTable.from_files: newFromArrayDouble returned {} for {}".format(error, path))
+                continue
+            wfmNum = first_wfm_num + len(table.entries)
+            table.entries.append(WaveformEntry(path, wfmNum, wave, waveform_digest(data), data.nbytes))
+        table._build_index()
+        return table
+
+    @classmethod
+    def pulse_widths(cls, count, wfmLen=200, first_wfm_num=1):
+        # count pulses of increasing width, spread evenly over wfmLen samples, e.g. to exercise large tables. Every
+        # width is different: wfmLen grows to count + 1 samples if it is shorter
+        wfmLen = max(wfmLen, count + 1)
+        samples = numpy.arange(wfmLen)
+        widths = [(index + 1) * wfmLen // (count + 1) for index in range(count)]
+        return cls([numpy.where(samples < width, 1.0, 0.0) for width in widths], first_wfm_num=first_wfm_num)
+
+    def _build_index(self):
+        self.numbers = [entry.wfmNum for entry in self.entries] # table order
+        self.by_name = {entry.name: entry.wfmNum for entry in self.entries}
+        self.following = dict(zip(self.numbers, self.numbers[1:] + self.numbers[:1])) # FORMAT: {WFMNUM: NEXT WFMNUM}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def number(self, key):
+        # Waveform number of an entry, by name or by position in the table
+        if isinstance(key, str):
+            return self.by_name[key]
+        return self.numbers[key]
+
+    def numbers_for(self, order):
+        # Waveform numbers of a selection order (names or positions), computed once up front
+        return [self.number(key) for key in order]
+
+    def next_number(self, wfmNum):
+        # Number that follows wfmNum in table order, wrapping around
+        return self.following.get(wfmNum, self.numbers[0])
+
+    @property
+    def nbytes(self):
+        return sum(entry.nbytes for entry in self.entries)
+
+    def load(self, moduleAOU):
+        # Makes every waveform of the table resident in moduleAOU's AWG memory (only changed waveforms are uploaded).
+        # Returns the list of (call, error code) that failed. A replacement that had to flush the memory (see
+        # waveform_cache.py) drops the entries loaded before it, so the table is gone through once more in that case
+        if not waveform_residency.is_tracked(moduleAOU):
+            error = waveform_residency.flush(moduleAOU)
+            if isinstance(error, int) and error < 0:
+                return [("waveformFlush", error)]
+        for attempt in range(0, 2):
+            generation = waveform_residency.generation(moduleAOU)
+            errors = []
+            for entry in self.entries:
+                error = waveform_residency.load(moduleAOU, entry.wave, entry.wfmNum, entry.digest, entry.nbytes)
+                if isinstance(error, int) and error < 0:
+                    errors.append(("waveformLoad({})".format(entry.wfmNum), error))
+            if waveform_residency.generation(moduleAOU) == generation:
+                break
+        return errors